@@ -0,0 +1,86 @@
+"""Measures the time taken to import :mod:`stored_procedures` and checks it against a budget.
+
+Run as ``python benchmarks/imports.py`` from a project using this package, with `DJANGO_SETTINGS_MODULE` set. Each import happens in a fresh interpreter in which django and MySQLdb have already been imported, so only the cost of this package itself is measured. The script exits with status 1 when the import exceeds its budget, pulls in one of the slow modules below, or touches the filesystem when a procedure is defined, so it can serve as a regression test."""
+import subprocess, sys
+
+# Milliseconds the import may take
+BUDGET = 25.0
+
+# Modules which are slow to import, and only needed once a procedure is used
+DEFERRED_MODULES = ('django.template', 'numpy', 'multiprocessing', 'decimal', 'csv')
+
+REPEAT = 5
+
+MEASUREMENT = '''
+import json, sys, time
+
+import django.db, django.conf, MySQLdb
+django.conf.settings.INSTALLED_APPS
+
+before = set(sys.modules)
+start = time.time()
+
+import stored_procedures
+
+elapsed = time.time() - start
+imported = sorted(name for name in set(sys.modules) - before if sys.modules[name] is not None)
+
+# Defining a procedure must not touch its file, which here does not even exist
+import __builtin__, codecs
+
+opened = []
+
+def recording(function):
+    def opener(name, *args, **kwargs):
+        opened.append(name)
+        return function(name, *args, **kwargs)
+
+    return opener
+
+__builtin__.open = recording(__builtin__.open)
+codecs.open = recording(codecs.open)
+
+stored_procedures.StoredProcedure('does/not/exist.sql', results = True)
+
+print json.dumps({'elapsed' : elapsed, 'imported' : imported, 'opened' : opened})
+'''
+
+def measure():
+    import json
+
+    output = subprocess.check_output([sys.executable, '-c', MEASUREMENT], stderr = subprocess.STDOUT)
+
+    return json.loads(output.splitlines()[-1])
+
+def main():
+    try:
+        measurements = [measure() for _ in xrange(REPEAT)]
+    except subprocess.CalledProcessError as exp:
+        print(exp.output)
+        print('FAILED: the measurement exited with status %d' % exp.returncode)
+        sys.exit(1)
+    best = min(measurement['elapsed'] for measurement in measurements) * 1000
+    imported = measurements[0]['imported']
+
+    print('import stored_procedures  %8.2f ms (budget %.2f ms)' % (best, BUDGET))
+    print('modules imported          %8d' % len(imported))
+
+    failures = []
+
+    if best > BUDGET:
+        failures.append('the import took %.2f ms, more than its budget of %.2f ms' % (best, BUDGET))
+
+    for name in DEFERRED_MODULES:
+        if name in imported:
+            failures.append('the import pulled in %s' % name)
+
+    for name in sorted(set(measurements[0]['opened'])):
+        failures.append('defining a procedure opened %s' % name)
+
+    for failure in failures:
+        print('FAILED: %s' % failure)
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
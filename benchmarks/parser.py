@@ -0,0 +1,44 @@
+"""Compares :func:`tokenizer.parseHeader` with the regular expressions it replaced on large procedures.
+
+Run as ``python benchmarks/parser.py``; it needs neither django nor a database."""
+import os, re, sys, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tokenizer import parseHeader
+
+# The regular expressions formerly used in procedure.py
+IN_OUT_STRING  = '(IN)|(OUT)|(INOUT)'
+argumentString = r'(?P<inout>' + IN_OUT_STRING + ')\s*(?P<name>[\w_]+)\s+(?P<type>.+?(?=(,\s*' + IN_OUT_STRING + ')|$))'
+argumentParser = re.compile(argumentString, re.DOTALL)
+
+methodParser = re.compile(r'CREATE\s+PROCEDURE\s+(?P<name>[\w_]+)\s*\(\s*(?P<arguments>.*)\)[^\)]*BEGIN', re.DOTALL)
+
+def regexParse(text):
+    match = methodParser.match(text)
+    return match.group('name'), [m.group('name') for m in argumentParser.finditer(match.group('arguments'))]
+
+def tokenizerParse(text):
+    header = parseHeader(text)
+    return header.name, [name for (name, _, _) in header.arguments]
+
+def procedure(argumentCount, statementCount):
+    arguments = '\n    ,   '.join('IN argument%d DECIMAL(10,2)' % i for i in range(argumentCount))
+    body = '\n'.join('    SELECT COUNT(*) INTO result FROM stock WHERE (amount > %d) AND BEGIN_DATE < NOW();' % i for i in range(statementCount))
+
+    return 'CREATE PROCEDURE benchmark\n    (\n        %s\n    )\n    READS SQL DATA\nBEGIN\n    DECLARE result INT;\n%s\nEND' % (arguments, body)
+
+def main():
+    for argumentCount, statementCount in ((5, 10), (5, 10000), (200, 10), (200, 10000)):
+        text = procedure(argumentCount, statementCount)
+        assert regexParse(text) == tokenizerParse(text)
+
+        for name, parse in (('regex', regexParse), ('tokenizer', tokenizerParse)):
+            timer = timeit.Timer(lambda: parse(text))
+            repeat = 20
+            best = min(timer.repeat(repeat = 3, number = repeat)) / repeat
+
+            print('%-10s arguments=%-4d statements=%-6d size=%-8d %10.3f ms' % (name, argumentCount, statementCount, len(text), best * 1000))
+
+if __name__ == '__main__':
+    main()
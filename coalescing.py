@@ -0,0 +1,57 @@
+import sys, threading
+
+class Flight():
+    def __init__(self):
+        """A call in progress, see :class:`CallCoalescer`."""
+        self.event      = threading.Event()
+        self.result     = None
+        self.exc_info   = None
+
+class CallCoalescer():
+    def __init__(self):
+        """Lets concurrent identical calls share a single execution.
+
+While a call with a certain key is in progress, any other call with the same key waits for it and receives its result, or raises its exception, instead of being executed itself. The result is shared, not copied."""
+        self._lock      = threading.Lock()
+        self._flights   = dict()
+
+    def call(self, key, function, timeout = None, expired = None):
+        """Gives the result of `function()`, unless a call with the same key is already in progress, in which case its result is given. The key must be hashable.
+
+:param timeout: the number of seconds to wait for a call in progress (default is `None`, no limit).
+:param expired: a function giving the exception to raise when the call in progress did not finish in time (default is `None`, raising :exc:`RuntimeError`)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = self._flights[key] = Flight()
+
+        if not leader:
+            flight.event.wait(timeout)
+
+            if not flight.event.is_set():
+                raise RuntimeError('The call in progress did not finish within %s seconds' % timeout) if expired is None else expired()
+
+            if flight.exc_info is not None:
+                raise flight.exc_info[0], flight.exc_info[1], flight.exc_info[2]
+
+            return flight.result
+
+        try:
+            flight.result = function()
+        except:
+            flight.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+            flight.event.set()
+
+        return flight.result
+
+    def inFlight(self):
+        """Gives the number of distinct calls in progress."""
+        with self._lock:
+            return len(self._flights)
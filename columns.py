@@ -0,0 +1,116 @@
+from MySQLdb.constants import FIELD_TYPE, FLAG
+from array import array
+import collections
+
+# Number of rows fetched from the cursor at once
+FETCH_SIZE = 4096
+
+INTEGER_TYPES = frozenset([
+        FIELD_TYPE.TINY
+    ,   FIELD_TYPE.SHORT
+    ,   FIELD_TYPE.LONG
+    ,   FIELD_TYPE.LONGLONG
+    ,   FIELD_TYPE.INT24
+    ,   FIELD_TYPE.YEAR
+])
+
+FLOAT_TYPES = frozenset([
+        FIELD_TYPE.FLOAT
+    ,   FIELD_TYPE.DOUBLE
+    ,   FIELD_TYPE.DECIMAL
+    ,   FIELD_TYPE.NEWDECIMAL
+])
+
+# NumPy, once imported by importNumpy
+_numpy = []
+
+def importNumpy():
+    """Gives the NumPy module, or `None` when it is not installed. Importing NumPy takes long, so this only happens when columns are first needed."""
+    if not _numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        _numpy.append(numpy)
+
+    return _numpy[0]
+
+def columnType(column, flags = 0):
+    """Classifies a column, given as an entry of `cursor.description` and its entry of `cursor.description_flags`, as `'int'`, `'uint'`, `'float'` or `'object'`. Only `BIGINT UNSIGNED` needs `'uint'`, as its values may exceed the range of a signed 64-bit integer. Integers that may be `NULL` are classified as floats, so that `NULL` can be represented by NaN."""
+    typeCode, nullable = column[1], column[6]
+
+    if typeCode in INTEGER_TYPES:
+        if nullable:
+            return 'float'
+
+        return 'uint' if typeCode == FIELD_TYPE.LONGLONG and flags & FLAG.UNSIGNED else 'int'
+    elif typeCode in FLOAT_TYPES:
+        return 'float'
+    else:
+        return 'object'
+
+def columnTypes(cursor):
+    """Classifies each column of `cursor`, see :func:`columnType`. Cursors that do not provide `description_flags` are taken to have signed columns only."""
+    flags = getattr(cursor, 'description_flags', None) or (0,) * len(cursor.description)
+
+    return [columnType(column, flag) for (column, flag) in zip(cursor.description, flags)]
+
+class Column():
+    def __init__(self, kind):
+        """A column that grows while rows are fetched, see :func:`fetchColumns`."""
+        self.kind = kind
+        self._numpy = numpy = importNumpy()
+
+        if numpy is not None:
+            self._chunks = []
+            self._dtype = {'int' : numpy.int64, 'uint' : numpy.uint64, 'float' : numpy.float64, 'object' : object}[kind]
+        elif kind == 'object':
+            self._values = []
+        else:
+            self._values = array({'int' : 'l', 'uint' : 'L', 'float' : 'd'}[kind])
+
+    def extend(self, values):
+        numpy = self._numpy
+
+        if numpy is not None:
+            self._chunks.append(numpy.array(values, dtype = self._dtype))
+        elif self.kind == 'float':
+            nan = float('nan')
+            self._values.extend(nan if value is None else float(value) for value in values)
+        else:
+            self._values.extend(values)
+
+    def finish(self):
+        numpy = self._numpy
+
+        if numpy is None:
+            return self._values
+        elif len(self._chunks) == 1:
+            return self._chunks[0]
+        elif len(self._chunks) == 0:
+            return numpy.empty(0, dtype = self._dtype)
+        else:
+            return numpy.concatenate(self._chunks)
+
+def fetchColumns(cursor, size = FETCH_SIZE):
+    """Fetches the rows from `cursor` as columns.
+
+:returns: An ordered dictionary mapping the name of each column to its values. With NumPy available these are arrays of type `int64`, `uint64` (for `BIGINT UNSIGNED`), `float64` or `object`; otherwise they are :class:`array.array` instances for numbers and lists for other values. Decimals are converted to floats and `NULL` in a numeric column becomes NaN.
+
+Rows are fetched `size` at a time, so with an unbuffered cursor the full list of rows never exists in memory."""
+    if cursor.description is None:
+        return collections.OrderedDict()
+
+    columns = [(column[0], Column(kind)) for (column, kind) in zip(cursor.description, columnTypes(cursor))]
+
+    while True:
+        rows = cursor.fetchmany(size)
+
+        if not rows:
+            break
+
+        for (_, column), values in zip(columns, zip(*rows)):
+            column.extend(values)
+
+    return collections.OrderedDict((name, column.finish()) for (name, column) in columns)
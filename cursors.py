@@ -0,0 +1,29 @@
+try:
+    from django.db import connection
+    from django.db.utils import DatabaseError
+except Exception as exp:
+    print exp
+
+from _mysql import DatabaseError as MySQLDatabaseError
+from MySQLdb.cursors import SSCursor
+
+# Errors raised by django's cursors, and by the MySQLdb cursors that unbufferedCursor
+# gives, which django does not wrap. The latter include MySQLdb's OperationalError,
+# ProgrammingError and IntegrityError.
+DATABASE_ERRORS = (DatabaseError, MySQLDatabaseError)
+
+def unbufferedCursor():
+    """Gives a cursor on django's database connection that does not buffer results on the client.
+
+Rows are read from the server while they are fetched, so a large result never has to fit in memory as a whole. Until the cursor is closed, which discards any rows not fetched, the connection can not be used for anything else."""
+    # Make sure the connection has been set up
+    connection.cursor().close()
+
+    return connection.connection.cursor(SSCursor)
+
+def discardCursor(cursor):
+    """Closes a cursor after an error. An unbuffered cursor that is not closed keeps the connection busy, but errors in closing it would hide the original error, so these are ignored."""
+    try:
+        cursor.close()
+    except Exception:
+        pass
@@ -0,0 +1,97 @@
+try:
+    from django.db import connection
+except Exception as exp:
+    print exp
+
+import collections, threading
+
+class BackgroundDeployment(threading.Thread):
+    def __init__(self, library, procedures, verbosity = 2, progress = None):
+        """Stores procedures in the database from a background thread, see :meth:`~library.StoredProcedureLibary.resetProcedures`.
+
+:param library: The library used to render the procedures.
+:param procedures: The procedures to store, in order.
+:param progress: A function which is given the procedure just handled, the number of procedures handled so far and the total number of procedures, after each procedure (default is `None`).
+
+A call to a procedure that is still waiting to be stored, waits for this procedure only: it is moved to the front of the queue. Exceptions raised while storing a procedure or reporting progress do not stop the deployment, they are collected in :attr:`errors`."""
+        threading.Thread.__init__(self, name = 'stored procedure deployment')
+        self.daemon = True
+
+        self._library   = library
+        self._verbosity = verbosity
+        self._progress  = progress
+        self._lock      = threading.Lock()
+        self._pending   = collections.deque(procedures)
+        self._events    = dict((procedure, threading.Event()) for procedure in procedures)
+
+        self.total  = len(self._pending)
+        self.done   = 0
+        self.errors = []
+
+        for procedure in procedures:
+            procedure._deployment = self
+
+    def wait(self, procedure, timeout = None):
+        """Waits until the given procedure has been stored, moving it to the front of the queue when it has not been started on yet.
+
+:returns: whether the procedure has been handled."""
+        with self._lock:
+            if procedure in self._pending:
+                self._pending.remove(procedure)
+                self._pending.appendleft(procedure)
+
+        event = self._events[procedure]
+        event.wait(timeout)
+
+        return event.is_set()
+
+    def run(self):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._pending) == 0:
+                        break
+
+                    procedure = self._pending.popleft()
+
+                try:
+                    procedure.resetProcedure(
+                            verbosity   = self._verbosity
+                        ,   library     = self._library
+                    )
+                except Exception as exp:
+                    self.errors.append(exp)
+
+                    if self._verbosity >= 1:
+                        print 'Unable to store %s: %s' % (procedure, exp)
+                finally:
+                    self.done += 1
+                    procedure._deployment = None
+                    self._events[procedure].set()
+
+                if self._progress is not None:
+                    try:
+                        self._progress(procedure, self.done, self.total)
+                    except Exception as exp:
+                        self.errors.append(exp)
+
+                        if self._verbosity >= 1:
+                            print 'Unable to report the progress of storing %s: %s' % (procedure, exp)
+
+            # Drop the versions superseded for longer than the grace period
+            try:
+                self._library.collectVersions(self._verbosity)
+            except Exception as exp:
+                self.errors.append(exp)
+        finally:
+            # Should the deployment end prematurely, calls waiting for the
+            # remaining procedures go ahead rather than block forever
+            with self._lock:
+                pending, self._pending = self._pending, collections.deque()
+
+            for procedure in pending:
+                procedure._deployment = None
+                self._events[procedure].set()
+
+            # Django keeps a connection for this thread, which is no longer needed
+            connection.close()
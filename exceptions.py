@@ -72,6 +72,56 @@ class IncorrectNumberOfArgumentsException(ProcedureExecutionException):
                 ,   self.operational_error
             )
 
+class ProcedureTimeoutException(ProcedureExecutionException):
+    def __init__(self, **kwargs):
+        """Raised when the stored procedure did not finish within its time limit. Its statement has been cancelled in the database.
+
+:param timeout: The time limit in seconds that was exceeded."""
+        self.timeout = kwargs.pop('timeout')
+        super(ProcedureTimeoutException, self).__init__(**kwargs)
+
+    def _description(self):
+        return 'The procedure did not finish within %s seconds and was cancelled, the database reported "%s"' % \
+            (
+                    self.timeout
+                ,   self.operational_error
+            )
+
+class ProcedureRejectedException(StoredProcedureException):
+    def __init__(self, **kwargs):
+        """Raised when a call to the stored procedure was not admitted by its concurrency limiter, because its queue was full or the call waited too long.
+
+:param limiter: The :class:`~limiter.ConcurrencyLimiter` that rejected the call."""
+        self.limiter = kwargs.pop('limiter')
+        super(ProcedureRejectedException, self).__init__(**kwargs)
+
+    def _description(self):
+        stats = self.limiter.stats()
+
+        return 'The call was rejected by the %s, with %d calls running and %d waiting' % \
+            (
+                    self.limiter
+                ,   stats['running']
+                ,   stats['queued']
+            )
+
+class ResultModelException(StoredProcedureException):
+    def __init__(self, **kwargs):
+        """Raised when the results of a stored procedure can not be turned into instances of its model, because they lack the primary key.
+
+:param model: The model the results should be instances of
+:param columns: The names of the columns in the results"""
+        self.model   = kwargs.pop('model')
+        self.columns = kwargs.pop('columns')
+        super(ResultModelException, self).__init__(**kwargs)
+
+    def _description(self):
+        return 'The results, with columns %s, lack the primary key of %s' % \
+            (
+                    ', '.join(self.columns)
+                ,   self.model.__name__
+            )
+
 class ProcedurePreparationException(StoredProcedureException):
     """Raised when something went wrong while preparing the stored procedure for being stored in the database"""
     pass
@@ -137,6 +187,17 @@ class FileDoesNotWorkException(ProcedureConfigurationException):
     def _description(self):
         return 'Unable to open desired file, raised %s' % self.file_error
 
+class DuplicateProcedureException(ProcedureConfigurationException):
+    def __init__(self, **kwargs):
+        """Raised when two registered stored procedures carry the same name.
+
+:param other: The procedure registered earlier under this name"""
+        self.other = kwargs.pop('other')
+        super(DuplicateProcedureException, self).__init__(**kwargs)
+
+    def _description(self):
+        return 'The procedure %s in %s has the same name' % (self.other.name, self.other.filename)
+
 class InitializationException(ProcedureConfigurationException):
     def __init__(self, **kwargs):
         """Raised when one of the arguments of the stored procedure's constructor was incorrect.
@@ -146,7 +207,7 @@ class InitializationException(ProcedureConfigurationException):
 :param value: The offending value."""
         self.field_name  = kwargs.pop('field_name')
         self.field_types = kwargs.pop('field_types')
-        self.value       = kwargs.pop('value')
+        self.value       = kwargs.pop('field_value')
         super(InitializationException, self).__init__(**kwargs)
 
     def _description(self):
@@ -209,3 +270,48 @@ class RawSQLWarning(RawSQLException):
         return 'Warning: %s' % \
             ', '.join(unicode(warning.message) for warning in self.warnings)
 
+
+class BundleException(Exception):
+    def __init__(self, filename, reason):
+        """Raised when a bundle of rendered procedures could not be used.
+
+:param filename: The bundle or manifest concerned
+:param reason: Description of what is wrong with it"""
+        self.filename = filename
+        self.reason   = reason
+
+    def __unicode__(self):
+        return 'Unable to use the bundle %s: %s' % (self.filename, self.reason)
+
+    def __str__(self):
+        return unicode(self).encode('utf8', 'replace')
+
+class ProcedureFileException(Exception):
+    def __init__(self, filename, reason):
+        """Raised when a file could not be read or split into stored procedures while discovering them.
+
+:param filename: The file concerned
+:param reason: The exception that occurred"""
+        # Passing the arguments on lets the exception travel between processes
+        super(ProcedureFileException, self).__init__(filename, reason)
+        self.filename = filename
+        self.reason   = reason
+
+    def __unicode__(self):
+        return 'Unable to read the stored procedures in %s: %s' % (self.filename, self.reason)
+
+    def __str__(self):
+        return unicode(self).encode('utf8', 'replace')
+
+class StatisticsUnavailableException(Exception):
+    def __init__(self, reason):
+        """Raised when the statistics of stored procedures could not be read from `performance_schema`, for example because it is disabled.
+
+:param reason: The exception that occurred, or a description of what is wrong"""
+        self.reason = reason
+
+    def __unicode__(self):
+        return 'Unable to read the statistics of stored procedures: %s' % self.reason
+
+    def __str__(self):
+        return unicode(self).encode('utf8', 'replace')
@@ -0,0 +1,241 @@
+from columns import columnTypes, importNumpy, FETCH_SIZE
+from array import array
+import collections, csv, datetime, decimal, json, mmap, struct
+
+# Layout of the columnar format, all numbers are little-endian:
+#
+#   header  COLUMNAR_MAGIC, the number of columns (uint32), and for each column
+#           the length of its name (uint16), its name in utf-8 and its kind
+#           ('i' for int64, 'u' for uint64, 'f' for float64 or 's' for text)
+#   chunks  the number of rows (uint32) followed by each column in turn.
+#           Numbers are stored as consecutive values, NULL floats being NaN.
+#           Text is stored as a byte per row which is 1 for NULL, the offsets
+#           of the values (uint32, one more than the number of rows) and the
+#           values in utf-8. Every column starts at a multiple of 8 bytes.
+#   end     a chunk of zero rows
+COLUMNAR_MAGIC = 'SPCOLS1\n'
+
+COLUMN_KINDS = {'int' : 'i', 'uint' : 'u', 'float' : 'f', 'object' : 's'}
+
+# The NumPy type, array type and struct format of each numeric kind
+NUMBER_FORMATS = {
+        'i' : ('<i8', 'l', 'q')
+    ,   'u' : ('<u8', 'L', 'Q')
+    ,   'f' : ('<f8', 'd', 'd')
+}
+
+def textValue(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, str):
+        return value
+
+    return unicode(value).encode('utf-8')
+
+def jsonValue(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    elif isinstance(value, decimal.Decimal):
+        return float(value)
+
+    return unicode(value)
+
+class CSVWriter():
+    def __init__(self, sink, cursor):
+        """Writes rows as comma-separated values, preceded by a row with the names of the columns. `NULL` is written as an empty field."""
+        self._writer = csv.writer(sink)
+        self._writer.writerow([textValue(column[0]) for column in cursor.description])
+
+    def write(self, rows):
+        self._writer.writerows(
+            [('' if value is None else textValue(value)) for value in row]
+            for row in rows
+        )
+
+    def close(self):
+        pass
+
+class JSONLinesWriter():
+    def __init__(self, sink, cursor):
+        """Writes each row as a JSON object on a line of its own, mapping the names of the columns to their values. Dates and times are written in ISO 8601 format, decimals as numbers."""
+        self._sink = sink
+        self._names = [column[0] for column in cursor.description]
+
+    def write(self, rows):
+        names = self._names
+
+        self._sink.write(''.join(
+                json.dumps(dict(zip(names, row)), default = jsonValue) + '\n'
+            for row in rows
+        ))
+
+    def close(self):
+        pass
+
+class ColumnarWriter():
+    def __init__(self, sink, cursor):
+        """Writes rows in a compact binary format in which each chunk of rows is stored column by column, see :func:`readColumnar`."""
+        self._sink = sink
+        description = cursor.description
+
+        self._kinds = [COLUMN_KINDS[kind] for kind in columnTypes(cursor)]
+        self._position = 0
+
+        self._write(COLUMNAR_MAGIC + struct.pack('<I', len(description)))
+
+        for column, kind in zip(description, self._kinds):
+            name = textValue(column[0])
+            self._write(struct.pack('<H', len(name)) + name + kind)
+
+    def _write(self, data):
+        self._sink.write(data)
+        self._position += len(data)
+
+    def _align(self):
+        padding = -self._position % 8
+
+        if padding:
+            self._write('\0' * padding)
+
+    def write(self, rows):
+        count = len(rows)
+        self._write(struct.pack('<I', count))
+
+        for kind, values in zip(self._kinds, zip(*rows)):
+            self._align()
+
+            if kind in 'iu':
+                self._write(struct.pack('<%d%s' % (count, NUMBER_FORMATS[kind][2]), *values))
+            elif kind == 'f':
+                nan = float('nan')
+                self._write(struct.pack('<%dd' % count, *[nan if value is None else float(value) for value in values]))
+            else:
+                texts = ['' if value is None else textValue(value) for value in values]
+                offsets = [0]
+
+                for text in texts:
+                    offsets.append(offsets[-1] + len(text))
+
+                self._write(''.join('\1' if value is None else '\0' for value in values))
+                self._align()
+                self._write(struct.pack('<%dI' % (count + 1), *offsets))
+                self._write(''.join(texts))
+
+    def close(self):
+        self._write(struct.pack('<I', 0))
+
+FORMATS = {
+        'csv'       : CSVWriter
+    ,   'jsonlines' : JSONLinesWriter
+    ,   'columnar'  : ColumnarWriter
+}
+
+def exportRows(cursor, sink, format = 'csv', progress = None, size = FETCH_SIZE):
+    """Writes all rows of `cursor` into the file-like object `sink`.
+
+:param format: one of `'csv'`, `'jsonlines'` or `'columnar'`, see :class:`CSVWriter`, :class:`JSONLinesWriter` and :class:`ColumnarWriter` respectively (default is `'csv'`).
+:param progress: a function which is given the number of rows written so far after each chunk (default is `None`).
+:param size: the number of rows fetched and written at once (default is :data:`~columns.FETCH_SIZE`).
+:returns: the number of rows written.
+:raises: :exc:`ValueError` for an unknown format.
+
+Only `size` rows are held in memory at any time, so with an unbuffered cursor the memory used does not depend on the size of the result."""
+    try:
+        writerClass = FORMATS[format]
+    except KeyError:
+        raise ValueError('Unknown export format %r, use one of %s' % (format, ', '.join(sorted(FORMATS))))
+
+    if cursor.description is None:
+        return 0
+
+    writer = writerClass(sink, cursor)
+    count = 0
+
+    while True:
+        rows = cursor.fetchmany(size)
+
+        if not rows:
+            break
+
+        writer.write(rows)
+        count += len(rows)
+
+        if progress is not None:
+            progress(count)
+
+    writer.close()
+
+    return count
+
+def readColumnar(filename):
+    """Reads a file written in the `'columnar'` format by memory-mapping it.
+
+:returns: a generator yielding each chunk of rows as an ordered dictionary from column names to their values. Numbers are NumPy arrays that refer directly to the mapped file when NumPy is available, and :class:`array.array` instances otherwise; text is a list of strings, with `None` for `NULL`.
+:raises: :exc:`IOError` when the file can not be opened, and :exc:`ValueError` when it is not in the columnar format. Both are raised by this function itself, before any chunk is read."""
+    with open(filename, 'rb') as fileHandler:
+        data = mmap.mmap(fileHandler.fileno(), 0, access = mmap.ACCESS_READ)
+
+    if data[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+        raise ValueError('%s is not in the columnar format' % filename)
+
+    position = len(COLUMNAR_MAGIC)
+    columns = []
+
+    try:
+        columnCount, = struct.unpack_from('<I', data, position)
+        position += 4
+
+        for _ in xrange(columnCount):
+            length, = struct.unpack_from('<H', data, position)
+            name = data[position + 2:position + 2 + length].decode('utf-8')
+            kind = data[position + 2 + length]
+            position += 3 + length
+
+            columns.append((name, kind))
+    except (struct.error, IndexError):
+        raise ValueError('%s ends within its header' % filename)
+
+    return readChunks(data, columns, position)
+
+def readChunks(data, columns, position):
+    """Yields the chunks of rows in the mapped columnar file `data`, the first of which starts at `position`, see :func:`readColumnar`."""
+    numpy = importNumpy()
+
+    def numbers(kind, position, count):
+        dtype, typeCode, structCode = NUMBER_FORMATS[kind]
+
+        if numpy is not None:
+            return numpy.frombuffer(data, dtype = dtype, count = count, offset = position)
+
+        return array(typeCode, struct.unpack_from('<%d%s' % (count, structCode), data, position))
+
+    while True:
+        count, = struct.unpack_from('<I', data, position)
+        position += 4
+
+        if count == 0:
+            return
+
+        chunk = collections.OrderedDict()
+
+        for name, kind in columns:
+            position += -position % 8
+
+            if kind in NUMBER_FORMATS:
+                chunk[name] = numbers(kind, position, count)
+                position += 8 * count
+            else:
+                nulls = data[position:position + count]
+                position += count
+                position += -position % 8
+
+                offsets = struct.unpack_from('<%dI' % (count + 1), data, position)
+                position += 4 * (count + 1)
+
+                chunk[name] = [
+                        None if nulls[index] == '\1' else data[position + offsets[index]:position + offsets[index + 1]].decode('utf-8')
+                    for index in xrange(count)
+                ]
+                position += offsets[-1]
+
+        yield chunk
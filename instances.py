@@ -0,0 +1,149 @@
+try:
+    from django.db import models, connection
+    from django.db.models.query_utils import deferred_class_factory
+except Exception as exp:
+    print exp
+
+from exceptions import InitializationException, ResultModelException
+from library import library
+
+class ModelFactory():
+    def __init__(self, procedure, model):
+        """Turns the results of a stored procedure into instances of a django model, like :meth:`django.db.models.query.QuerySet.raw` does.
+
+:param procedure: the stored procedure whose results are turned into instances.
+:param model: the model, either as a class or as a label `'app.Model'`, which is only looked up when the first results arrive.
+
+Columns are matched to fields by means of the names in :attr:`~library.StoredProcedureLibary.modelLibrary`, once for each shape of result, as given by the column names in `cursor.description`. Fields for which there is no column are deferred, so they are only loaded from the database when they are accessed. Columns that do not match a field are set as attributes of the instances, as annotations would be."""
+        self.rows = 'tuple'
+        self._procedure = procedure
+        self._model = model
+        self._builders = dict()
+
+    unbuffered = property(
+            fget = lambda self: False
+        ,   doc  = 'Whether the results should be fetched from an unbuffered cursor'
+    )
+
+    @property
+    def model(self):
+        """The model of the instances.
+
+:raises: :exc:`~exceptions.InitializationException` when there is no model with the given label."""
+        if isinstance(self._model, basestring):
+            label = self._model
+            model = models.get_model(*label.split('.', 1)) if label.count('.') == 1 else None
+
+            if model is None:
+                raise InitializationException(
+                        procedure   = self._procedure
+                    ,   field_name  = 'model'
+                    ,   field_types = (None, 'model', 'app.Model')
+                    ,   field_value = label
+                )
+
+            self._model = model
+
+        return self._model
+
+    def columnFields(self):
+        """Gives a dictionary from the names of the columns of the model to the names of their fields."""
+        model = self.model
+        prefix = '%s.%s.' % (model._meta.app_label, model.__name__)
+
+        return dict(
+                (column.strip('`"'), key[len(prefix):])
+            for key, column in library.modelLibrary.iteritems()
+            if key.startswith(prefix) and not key.endswith('.pk')
+        )
+
+    def builder(self, description):
+        """Gives the function turning a row of a result with the given `cursor.description` into an instance."""
+        names = tuple(column[0] for column in description)
+
+        try:
+            return self._builders[names]
+        except KeyError:
+            builder = self._builders[names] = self._makeBuilder(names)
+
+            return builder
+
+    def _makeBuilder(self, names):
+        model = self.model
+        meta = model._meta
+        columnFields = self.columnFields()
+
+        fields = []
+        annotations = []
+
+        for index, name in enumerate(names):
+            if name in columnFields:
+                fields.append((index, meta.get_field(columnFields[name]).attname))
+            else:
+                annotations.append((index, name))
+
+        present = set(attname for (index, attname) in fields)
+
+        if not meta.pk.attname in present:
+            raise ResultModelException(
+                    procedure = self._procedure
+                ,   model     = model
+                ,   columns   = names
+            )
+
+        deferred = set(field.attname for field in meta.fields) - present
+        modelClass = deferred_class_factory(model, deferred) if deferred else model
+        alias = connection.alias
+
+        def build(row):
+            instance = modelClass(**dict((attname, row[index]) for (index, attname) in fields))
+
+            for index, name in annotations:
+                setattr(instance, name, row[index])
+
+            instance._state.db = alias
+            instance._state.adding = False
+
+            return instance
+
+        return build
+
+    def fetch(self, cursor):
+        """Fetches all results from the cursor, see :class:`ModelRows`."""
+        rows = cursor.fetchall()
+
+        if cursor.description is None:
+            return rows
+
+        return ModelRows(self.builder(cursor.description), rows)
+
+class ModelRows():
+    def __init__(self, build, rows):
+        """The results of a stored procedure as a sequence of model instances, each of which is only built when it is first accessed.
+
+:param build: the function turning a row into an instance, see :meth:`ModelFactory.builder`.
+:param rows: the rows of the result."""
+        self._build = build
+        self._rows = rows
+        self._instances = [None] * len(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in xrange(*index.indices(len(self)))]
+
+        instance = self._instances[index]
+
+        if instance is None:
+            instance = self._instances[index] = self._build(self._rows[index])
+
+        return instance
+
+    def __iter__(self):
+        for index in xrange(len(self._rows)):
+            yield self[index]
+
+    def __repr__(self):
+        return '<ModelRows: %d rows>' % len(self._rows)
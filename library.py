@@ -1,14 +1,30 @@
 try:
     from django.db.models.signals import post_syncdb
     from django.db import models, connection
+    from django.conf import settings
 except Exception as exp:
     print exp
 
-import re
+import codecs, hashlib, json, os, re, threading
+
+from tokenizer import splitRoutines, ParseError
+from exceptions import BundleException, DuplicateProcedureException, InitializationException, ProcedureConfigurationException, ProcedureFileException
+from deployment import BackgroundDeployment
+from limiter import ConcurrencyLimiter
+
+# Statement delimiter used in bundles, for the mysql client
+BUNDLE_DELIMITER = '$$'
+
+# Number of seconds superseded versions of procedures are kept, see collectVersions
+VERSION_GRACE = 3600
 
 class StoredProcedureLibary():
     def __init__(self):
         self._procedures = []
+        self._index = None
+        self._indexFailures = []
+        self._limiters = dict()
+        self._limiterLock = threading.Lock()
         self._reset = False
         self._modelLibrary = None
         self._nameRegexp = re.compile( r'\[(?P<token>[_\w]+(.[_\w]+)*)\]', re.UNICODE)
@@ -50,27 +66,338 @@ class StoredProcedureLibary():
 
         return self._nameRegexp.sub(fill_in_names, sql)
 
+    def references(self, sql):
+        """Gives the set of models, as `app.Model`, to which the given SQL refers by means of `[app.Model]`, `[app.Model.field]` or `[app.Model.pk]`."""
+        return frozenset(
+                '.'.join(match.group('token').split('.')[:2])
+            for match in self._nameRegexp.finditer(sql)
+        )
+
     def registerProcedure(self, procedure):
         """Each stored procedure is registered with the library."""
         self._procedures.append(procedure)
 
-    def resetProcedures(self, verbosity, force_repeat = False):
+        # Names may have to be read from the procedures' files, so only index
+        # them once a procedure is looked up
+        self._index = None
+
+    def index(self):
+        """Gives a dictionary from the names of the registered procedures to the procedures themselves. Procedures whose name can not be determined, because their file can not be read or parsed, are left out.
+
+:raises: :exc:`~exceptions.DuplicateProcedureException` when two procedures carry the same name."""
+        index = self._index
+
+        if index is None:
+            index = dict()
+            failures = []
+
+            for procedure in self._procedures:
+                try:
+                    name = procedure.name
+                except ProcedureConfigurationException as exp:
+                    failures.append((procedure, exp))
+                    continue
+
+                if name in index:
+                    raise DuplicateProcedureException(
+                            procedure   = procedure
+                        ,   other       = index[name]
+                    )
+
+                index[name] = procedure
+
+            self._index, self._indexFailures = index, failures
+
+        return index
+
+    def __getitem__(self, name):
+        """Gives the stored procedure registered under the given name.
+
+:raises: :exc:`KeyError` when no such procedure is registered. When the name was not found, but the file of a procedure whose name could not be determined is named after it, the :exc:`~exceptions.ProcedureConfigurationException` of this procedure is raised instead."""
+        index = self.index()
+
+        if not name in index:
+            for procedure, exp in self._indexFailures:
+                if os.path.splitext(os.path.basename(procedure.filename))[0] == name:
+                    raise exp
+
+        return index[name]
+
+    def __contains__(self, name):
+        return name in self.index()
+
+    def limiter(self, name, procedure = None):
+        """Gives the :class:`~limiter.ConcurrencyLimiter` shared by the group of procedures with the given name. Groups are configured in the setting `STORED_PROCEDURES_CONCURRENCY`, a dictionary mapping the name of each group to the keyword arguments of its limiter, for example ``{'reports' : {'limit' : 4, 'max_queue' : 20}}``.
+
+:param procedure: the procedure asking for the limiter, to be named when the group is not configured (default is `None`).
+:raises: :exc:`~exceptions.InitializationException` when the group is not configured."""
+        with self._limiterLock:
+            if not name in self._limiters:
+                groups = getattr(settings, 'STORED_PROCEDURES_CONCURRENCY', {})
+
+                if not name in groups:
+                    raise InitializationException(
+                            procedure   = procedure
+                        ,   field_name  = 'concurrency'
+                        ,   field_types = sorted(groups) or ['a group configured in STORED_PROCEDURES_CONCURRENCY']
+                        ,   field_value = name
+                    )
+
+                configuration = groups[name]
+                self._limiters[name] = ConcurrencyLimiter(name = name, **configuration)
+
+            return self._limiters[name]
+
+    def discoverProcedures(self, directories = None, extensions = ('.sql',), processes = None, **options):
+        """Registers all stored procedures and functions in the given directories.
+
+:param directories: the directories to scan recursively (default is the setting `STORED_PROCEDURES_DIRS`). When the setting IN_SITE_ROOT is available, it is used to make these absolute.
+:type directories: list of strings
+:param extensions: only files with these extensions are read (default is `('.sql',)`)
+:param processes: the number of processes reading and splitting files in parallel, with `1` everything is done in the current process (default is the number of CPUs)
+:type processes: `int`
+:returns: the list of discovered :class:`~procedure.StoredProcedure` instances, in order of filename and position within the file.
+:raises: :exc:`~exceptions.ProcedureFileException` when a file could not be read or split, naming this file.
+
+A file may contain several `CREATE PROCEDURE` and `CREATE FUNCTION` statements, each of which becomes a separate stored procedure. All other keyword arguments are passed on to the constructor of each :class:`~procedure.StoredProcedure`, their name and arguments are always inferred."""
+        from procedure import StoredProcedure
+
+        if directories is None:
+            directories = getattr(settings, 'STORED_PROCEDURES_DIRS', ())
+
+        filenames = []
+
+        for directory in directories:
+            if hasattr(settings, 'IN_SITE_ROOT'):
+                directory = settings.IN_SITE_ROOT(directory)
+
+            for root, _, files in os.walk(directory):
+                filenames.extend(
+                        os.path.join(root, filename)
+                    for filename in files
+                    if os.path.splitext(filename)[1] in extensions
+                )
+
+        filenames.sort()
+
+        from multiprocessing import Pool, cpu_count
+
+        if processes is None:
+            processes = cpu_count()
+
+        if processes > 1 and len(filenames) > 1:
+            pool = Pool(min(processes, len(filenames)))
+
+            try:
+                contents = pool.map(readProcedureFile, filenames)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            contents = map(readProcedureFile, filenames)
+
+        return [
+                StoredProcedure(filename, raw_sql = raw_sql, **options)
+            for (filename, sources) in zip(filenames, contents)
+            for raw_sql in sources
+        ]
+
+    def compileBundle(self, bundleFilename, manifestFilename):
+        """Renders all registered procedures into a single SQL file, the bundle, and describes it in a manifest.
+
+:param bundleFilename: the file to write the bundle to. It drops and creates every procedure, ordered by name, and can be deployed by the mysql client directly. When deploying versioned (see :attr:`~procedure.StoredProcedure.versioned`), it creates the current version of every procedure instead and drops nothing; a version that exists already then gives an error, which `mysql --force` skips. Superseded versions are marked as such once the application stores its procedures, see :meth:`~procedure.StoredProcedure.send_to_database`.
+:param manifestFilename: the file to write the manifest to, a JSON document holding the SHA-1 digests of the bundle and of the model library and, for each procedure, its name, kind, arguments, the digests of its source, of its rendering context and of its rendered statement, and the position of this statement within the bundle, as well as the position and original text of its name when the bundle is versioned.
+:returns: the manifest.
+
+The bundle can be used in place of rendering, see :meth:`~library.StoredProcedureLibary.loadBundle`.
+
+:raises: :exc:`~exceptions.ProcedureConfigurationException` when a procedure could not be read or parsed, or when two procedures carry the same name."""
+        procedures = self.index()
+
+        # A bundle which silently lacks procedures is of no use
+        for _, exp in self._indexFailures:
+            raise exp
+
+        parts = [u'-- Stored procedures, generated by compileprocedures\nDELIMITER %s\n\n' % BUNDLE_DELIMITER]
+        position = len(parts[0].encode('utf-8'))
+        entries = []
+
+        for name in sorted(procedures):
+            procedure = procedures[name]
+            procedure.renderProcedure(self)
+
+            # The statement comes without its final semicolon, the bundle delimits
+            # statements itself
+            statement = procedure.sql
+            entry = dict()
+
+            if procedure.versioned:
+                # Processes call the version, so it is created in place of the
+                # procedure, which must not be dropped
+                statement, nameStart, nameEnd = procedure.versionedStatement()
+                header = u'-- %s %s\n' % (name, procedure.checksum)
+
+                entry['version'] = {
+                        'start' : nameStart
+                    ,   'end'   : nameEnd
+                    ,   'name'  : procedure.sql[nameStart:nameEnd + len(procedure.sql) - len(statement)]
+                }
+            else:
+                header = u'-- %s %s\nDROP %s IF EXISTS %s%s\n' % \
+                    (
+                            name
+                        ,   procedure.checksum
+                        ,   procedure.kind
+                        ,   connection.ops.quote_name(name)
+                        ,   BUNDLE_DELIMITER
+                    )
+
+            position += len(header.encode('utf-8'))
+            length = len(statement.encode('utf-8'))
+
+            entry.update({
+                    'name'      : name
+                ,   'kind'      : procedure.kind
+                ,   'arguments' : list(procedure.arguments)
+                ,   'source'    : sourceChecksum(procedure)
+                ,   'context'   : contextChecksum(procedure)
+                ,   'checksum'  : procedure.checksum
+                ,   'filename'  : procedure.filename
+                ,   'start'     : position
+                ,   'end'       : position + length
+            })
+            entries.append(entry)
+
+            parts.extend([header, statement, u'%s\n\n' % BUNDLE_DELIMITER])
+            position += length + len(BUNDLE_DELIMITER) + 2
+
+        parts.append(u'DELIMITER ;\n')
+        bundle = u''.join(parts).encode('utf-8')
+
+        with open(bundleFilename, 'wb') as fileHandler:
+            fileHandler.write(bundle)
+
+        manifest = {
+                'bundle'        : os.path.relpath(bundleFilename, os.path.dirname(os.path.abspath(manifestFilename)))
+            ,   'checksum'      : hashlib.sha1(bundle).hexdigest()
+            ,   'models'        : self.modelLibraryChecksum()
+            ,   'procedures'    : entries
+        }
+
+        with open(manifestFilename, 'w') as fileHandler:
+            json.dump(manifest, fileHandler, indent = 4, sort_keys = True)
+
+        return manifest
+
+    def loadBundle(self, manifestFilename):
+        """Takes the rendered procedures from a bundle written by :meth:`~library.StoredProcedureLibary.compileBundle`, so that they need not be rendered again.
+
+:returns: the list of procedures taken from the bundle.
+:raises: :exc:`~exceptions.BundleException` when the bundle does not match its manifest.
+
+Only registered procedures whose source and rendering context are unchanged since the bundle was compiled are taken from it, all others are rendered as usual. When the models have changed, for example by a migration renaming a column, none are taken from it."""
+        with open(manifestFilename) as fileHandler:
+            manifest = json.load(fileHandler)
+
+        bundleFilename = os.path.join(os.path.dirname(os.path.abspath(manifestFilename)), manifest['bundle'])
+
+        with open(bundleFilename, 'rb') as fileHandler:
+            bundle = fileHandler.read()
+
+        if hashlib.sha1(bundle).hexdigest() != manifest['checksum']:
+            raise BundleException(bundleFilename, 'its checksum does not match the manifest %s' % manifestFilename)
+
+        loaded = []
+
+        # The statements refer to the tables and columns the models had then
+        if manifest.get('models') != self.modelLibraryChecksum():
+            return loaded
+
+        for entry in manifest['procedures']:
+            if not entry['name'] in self:
+                continue
+
+            procedure = self[entry['name']]
+
+            if sourceChecksum(procedure) != entry['source'] or contextChecksum(procedure) != entry.get('context'):
+                continue
+
+            statement = bundle[entry['start']:entry['end']].decode('utf-8')
+
+            # A versioned bundle holds the statements creating the versions
+            if 'version' in entry:
+                version = entry['version']
+                statement = statement[:version['start']] + version['name'] + statement[version['end']:]
+
+            procedure.setRendered(statement, prerendered = True)
+
+            if procedure.checksum != entry['checksum']:
+                raise BundleException(bundleFilename, 'the statement of %s does not match its checksum' % entry['name'])
+
+            loaded.append(procedure)
+
+        return loaded
+
+    def resetProcedures(self, verbosity, force_repeat = False, background = False, progress = None):
+        """Renders all registered procedures and stores them in the database, but only once unless `force_repeat` is set.
+
+:param background: whether to store the procedures from a background thread, in which case this method returns immediately (default is `False`). Calls to a procedure wait until this procedure has been stored, see :class:`~deployment.BackgroundDeployment`.
+:param progress: a function which is given the procedure just stored, the number of procedures stored so far and the total number of procedures, after each procedure (default is `None`).
+:returns: the :class:`~deployment.BackgroundDeployment` when storing in the background, `None` otherwise."""
         if self._reset and not force_repeat:
             return
 
         self._reset = True
 
-        for procedure in self.procedures:
+        # Use the prerendered procedures, whenever available
+        if getattr(settings, 'STORED_PROCEDURES_BUNDLE', None) is not None:
+            self.loadBundle(settings.STORED_PROCEDURES_BUNDLE)
+
+        procedures = list(self.procedures)
+
+        if background:
+            deployment = BackgroundDeployment(self, procedures, verbosity, progress)
+            deployment.start()
+
+            return deployment
+
+        for done, procedure in enumerate(procedures, 1):
             procedure.resetProcedure(
                     verbosity   = verbosity
                 ,   library     = self
             )
 
+            if progress is not None:
+                progress(procedure, done, len(procedures))
+
+        self.collectVersions(verbosity)
+
+    def collectVersions(self, verbosity = 2, grace = None):
+        """Drops the versions of all registered procedures which were superseded more than `grace` seconds ago, when deploying versioned. See :meth:`~procedure.StoredProcedure.collectVersions`.
+
+:param grace: the number of seconds superseded versions are kept, which should exceed the time it takes for all processes to run the new code (default is the setting `STORED_PROCEDURES_VERSION_GRACE`, or an hour).
+:returns: the names of the versions dropped."""
+        if not getattr(settings, 'STORED_PROCEDURES_VERSIONED', False):
+            return []
+
+        if grace is None:
+            grace = getattr(settings, 'STORED_PROCEDURES_VERSION_GRACE', VERSION_GRACE)
+
+        return [
+                name
+            for procedure in self.procedures
+            for name in procedure.collectVersions(grace, verbosity)
+        ]
+
     procedures = property(
             fget = lambda self: self._procedures
         ,   doc  = 'List of all stored procedures registered at the library'
     )
 
+    def modelLibraryChecksum(self):
+        """Gives the SHA-1 digest of the model library, the names of the tables and columns procedures may refer to."""
+        return hashlib.sha1(json.dumps(self.modelLibrary, sort_keys = True)).hexdigest()
+
     @property
     def modelLibrary(self):
         if self._modelLibrary is None:
@@ -84,11 +411,39 @@ def registerProcedure(procedure):
     """Registers a procedure with the libary."""
     library.registerProcedure(procedure)
 
-def resetProcedures(verbosity = 2):
-    """Resets all procedures registered with the library in the database."""
-    library.resetProcedures(verbosity)
+def discoverProcedures(directories = None, **options):
+    """Registers all stored procedures in the given directories with the library, see :meth:`~library.StoredProcedureLibary.discoverProcedures`."""
+    return library.discoverProcedures(directories, **options)
+
+def sourceChecksum(procedure):
+    """Gives the SHA-1 digest of the unrendered procedure."""
+    raw_sql = procedure.raw_sql
+
+    if isinstance(raw_sql, unicode):
+        raw_sql = raw_sql.encode('utf-8')
+
+    return hashlib.sha1(raw_sql).hexdigest()
+
+def contextChecksum(procedure):
+    """Gives the SHA-1 digest of the context the procedure is rendered with. Values which cannot be written as JSON are taken by their representation."""
+    return hashlib.sha1(json.dumps(procedure.renderingContext(), sort_keys = True, default = repr)).hexdigest()
+
+def readProcedureFile(filename):
+    """Reads a file, which is assumed to be stored in utf-8 encoding, and splits it into the stored procedures it contains.
+
+:raises: :exc:`~exceptions.ProcedureFileException` when the file could not be read or split."""
+    try:
+        with codecs.open(filename, 'r', 'utf-8') as fileHandler:
+            return splitRoutines(fileHandler.read())
+    except (IOError, UnicodeDecodeError, ParseError) as exp:
+        raise ProcedureFileException(filename, exp)
+
+def resetProcedures(verbosity = 2, background = False, progress = None):
+    """Resets all procedures registered with the library in the database, see :meth:`~library.StoredProcedureLibary.resetProcedures`."""
+    return library.resetProcedures(verbosity, background = background, progress = progress)
 
 def reset(sender, **kwargs):
+    """Resets all procedures after a migration. This never happens in the background: the migrate command exits when done, which would kill the deployment thread halfway."""
     resetProcedures(1)
 
 # Connect to syncdb
@@ -0,0 +1,134 @@
+import heapq, itertools, threading, time
+
+# Priority classes; calls with a lower priority are admitted first
+HIGH    = 0
+NORMAL  = 1
+LOW     = 2
+
+class Waiter():
+    def __init__(self):
+        """A call waiting in the queue of a :class:`ConcurrencyLimiter`."""
+        self.event      = threading.Event()
+        self.admitted   = False
+        self.cancelled  = False
+
+class ConcurrencyLimiter():
+    def __init__(self, limit, max_queue = None, max_wait = None, name = None):
+        """Limits the number of calls running at the same time.
+
+:param limit: the number of calls that may run at the same time.
+:type limit: `int`
+:param max_queue: the number of calls that may wait for their turn, any further call is rejected immediately. With `0`, calls are rejected as soon as the limit is reached (default is `None`, no limit).
+:param max_wait: the number of seconds a call may wait before it is rejected (default is `None`, no limit).
+:param name: a name to identify the limiter by, for example the group of procedures it is shared by, or a function giving this name when it is first needed (default is `None`).
+
+Waiting calls are admitted in order of priority (see :data:`HIGH`, :data:`NORMAL` and :data:`LOW`), and in order of arrival within the same priority. The same limiter can be given to several procedures to limit them as a group."""
+        self.limit      = limit
+        self.max_queue  = max_queue
+        self.max_wait   = max_wait
+        self._name      = name
+
+        self._lock      = threading.Lock()
+        self._queue     = []
+        self._order     = itertools.count()
+        self._running   = 0
+        self._queued    = 0
+
+        # Statistics
+        self._calls         = 0
+        self._rejected      = 0
+        self._waited        = 0
+        self._totalWait     = 0.0
+        self._longestWait   = 0.0
+        self._longestQueue  = 0
+
+    def acquire(self, priority = NORMAL, timeout = None):
+        """Waits until the call may run.
+
+:param timeout: the number of seconds the call may wait, when shorter than `max_wait` (default is `None`, only `max_wait` applies).
+:returns: `True` when the call may run, after which :meth:`release` must be called, or `False` when the call is rejected."""
+        with self._lock:
+            self._calls += 1
+
+            if self._running < self.limit and self._queued == 0:
+                self._running += 1
+                return True
+
+            if self.max_queue is not None and self._queued >= self.max_queue:
+                self._rejected += 1
+                return False
+
+            waiter = Waiter()
+            heapq.heappush(self._queue, (priority, next(self._order), waiter))
+            self._queued += 1
+            self._longestQueue = max(self._longestQueue, self._queued)
+
+        wait = self.max_wait if timeout is None else timeout if self.max_wait is None else min(timeout, self.max_wait)
+
+        start = time.time()
+        waiter.event.wait(wait)
+        waited = time.time() - start
+
+        with self._lock:
+            self._waited += 1
+            self._totalWait += waited
+            self._longestWait = max(self._longestWait, waited)
+
+            if waiter.admitted:
+                return True
+
+            # Waited too long, leave the queue
+            waiter.cancelled = True
+            self._queued -= 1
+            self._rejected += 1
+
+            return False
+
+    def release(self):
+        """Signals that a call admitted by :meth:`acquire` has finished, admitting the next waiting call."""
+        with self._lock:
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+
+                if waiter.cancelled:
+                    continue
+
+                # Hand over the slot of the finished call
+                self._queued -= 1
+                waiter.admitted = True
+                waiter.event.set()
+
+                return
+
+            self._running -= 1
+
+    @property
+    def name(self):
+        """The name of the limiter, or `None`"""
+        if callable(self._name):
+            self._name = self._name()
+
+        return self._name
+
+    def stats(self):
+        """Gives a dictionary with the current number of `running` and `queued` calls, and over the lifetime of the limiter, the number of `calls`, `rejected` calls, calls that `waited`, the `total_wait` and `longest_wait` in seconds, and the `longest_queue`."""
+        with self._lock:
+            return {
+                    'running'       : self._running
+                ,   'queued'        : self._queued
+                ,   'calls'         : self._calls
+                ,   'rejected'      : self._rejected
+                ,   'waited'        : self._waited
+                ,   'total_wait'    : self._totalWait
+                ,   'longest_wait'  : self._longestWait
+                ,   'longest_queue' : self._longestQueue
+            }
+
+    def __unicode__(self):
+        if self.name is None:
+            return u'concurrency limiter (%d at once)' % self.limit
+
+        return u'concurrency limiter of %s (%d at once)' % (self.name, self.limit)
+
+    def __str__(self):
+        return unicode(self).encode('utf8', 'replace')
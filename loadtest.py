@@ -0,0 +1,289 @@
+import contextlib, itertools, math, threading, time
+
+from exceptions import *
+from library import library
+
+# MySQL error code of a deadlock, after which the transaction may be retried
+ER_LOCK_DEADLOCK = 1213
+
+class FakeCursor():
+    def __init__(self, rows, description, latency):
+        """Cursor of a :class:`FakeConnection`, yielding the same rows for every statement."""
+        self._rows          = rows
+        self._description   = description
+        self._latency       = latency
+        self._fetched       = None
+        self.description    = None
+
+    def execute(self, sql, args = ()):
+        if self._latency:
+            time.sleep(self._latency)
+
+        self._fetched = list(self._rows)
+        self.description = self._description
+
+        return len(self._fetched)
+
+    def fetchmany(self, size = 1):
+        rows, self._fetched = self._fetched[:size], self._fetched[size:]
+
+        return rows
+
+    def fetchall(self):
+        rows, self._fetched = self._fetched, []
+
+        return rows
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        self._fetched = None
+
+class FakeOperations():
+    """The database operations of a :class:`FakeConnection`, quoting names as MySQL does."""
+    def quote_name(self, name):
+        return name if name.startswith('`') else '`%s`' % name
+
+class FakeConnection():
+    def __init__(self, rows = ((1,),), description = (('result', 8, None, None, None, None, False),), latency = 0):
+        """Stands in for django's database connection, so that the overhead of this library can be measured without a database.
+
+:param rows: the rows every statement yields.
+:param description: the `cursor.description` of these rows.
+:param latency: the number of seconds each statement takes.
+
+It provides just enough of django's connection, and of the MySQLdb connection it wraps, for calls to :class:`~procedure.StoredProcedure` and :class:`~sql.SQL` objects. Use it by means of :func:`usingConnection`."""
+        self.rows           = rows
+        self.description    = description
+        self.latency        = latency
+        self.ops            = FakeOperations()
+
+    # The MySQLdb connection, see cursors.unbufferedCursor and watchdog.QueryWatchdog
+    connection = property(lambda self: self)
+
+    def cursor(self, cursorClass = None):
+        return FakeCursor(self.rows, self.description, self.latency)
+
+    def thread_id(self):
+        return 0
+
+    def close(self):
+        pass
+
+@contextlib.contextmanager
+def usingConnection(fakeConnection):
+    """Makes all stored procedures and raw SQL use `fakeConnection` instead of django's connection while in this context. When `fakeConnection` is `None`, nothing is changed.
+
+This is meant for load testing only: it affects all threads."""
+    if fakeConnection is None:
+        yield
+        return
+
+    import procedure, sql, cursors, watchdog
+
+    modules = (procedure, sql, cursors, watchdog)
+    originals = [module.__dict__.get('connection') for module in modules]
+
+    for module in modules:
+        module.connection = fakeConnection
+
+    try:
+        yield
+    finally:
+        for module, original in zip(modules, originals):
+            module.connection = original
+
+def errorCode(exp):
+    """Gives the MySQL error code underlying an exception raised by a stored procedure or raw SQL, if any."""
+    if isinstance(exp, ProcedureExecutionException):
+        error = exp.operational_error
+    elif isinstance(exp, RawSQLException) and len(exp.args) > 0:
+        error = exp.args[0]
+    else:
+        return None
+
+    args = getattr(error, 'args', ())
+
+    return args[0] if len(args) > 0 else None
+
+def splitArguments(arguments):
+    """Turns a list or dictionary of arguments into arguments and keyword arguments."""
+    if arguments is None:
+        return (), {}
+    elif isinstance(arguments, dict):
+        return (), dict(arguments)
+
+    return tuple(arguments), {}
+
+class LoadTestReport():
+    def __init__(self, latencies = (), errors = 0, warnings = 0, retries = 0, elapsed = 0.0):
+        """The outcome of :func:`runLoadTest`.
+
+:param latencies: the number of seconds each call took, including retries.
+:param errors: the number of calls that raised an exception.
+:param warnings: the number of calls that raised a warning as an exception.
+:param retries: the number of times a call was retried after a deadlock.
+:param elapsed: the number of seconds the test took."""
+        self.latencies  = sorted(latencies)
+        self.errors     = errors
+        self.warnings   = warnings
+        self.retries    = retries
+        self.elapsed    = elapsed
+
+    calls = property(
+            fget = lambda self: len(self.latencies)
+        ,   doc  = 'The number of calls made'
+    )
+
+    throughput = property(
+            fget = lambda self: self.calls / self.elapsed if self.elapsed > 0 else 0.0
+        ,   doc  = 'The number of calls per second'
+    )
+
+    errorRate = property(
+            fget = lambda self: float(self.errors) / self.calls if self.calls else 0.0
+        ,   doc  = 'The fraction of calls that raised an exception'
+    )
+
+    warningRate = property(
+            fget = lambda self: float(self.warnings) / self.calls if self.calls else 0.0
+        ,   doc  = 'The fraction of calls that raised a warning'
+    )
+
+    def percentile(self, percentage):
+        """Gives the latency, in seconds, below which the given percentage of calls finished."""
+        if not self.latencies:
+            return 0.0
+
+        index = int(math.ceil(percentage / 100.0 * len(self.latencies))) - 1
+
+        return self.latencies[min(max(index, 0), len(self.latencies) - 1)]
+
+    def merge(self, report):
+        """Adds the calls of another report, made concurrently with the calls of this report."""
+        self.latencies  = sorted(self.latencies + report.latencies)
+        self.errors     += report.errors
+        self.warnings   += report.warnings
+        self.retries    += report.retries
+        self.elapsed    = max(self.elapsed, report.elapsed)
+
+    def __unicode__(self):
+        return u'\n'.join([
+                u'calls:       %d in %.2f seconds (%.1f per second)' % (self.calls, self.elapsed, self.throughput)
+            ,   u'latency:     p50 %.2f ms, p90 %.2f ms, p99 %.2f ms, max %.2f ms' % tuple(1000 * self.percentile(p) for p in (50, 90, 99, 100))
+            ,   u'errors:      %d (%.2f%%)' % (self.errors, 100 * self.errorRate)
+            ,   u'warnings:    %d (%.2f%%)' % (self.warnings, 100 * self.warningRate)
+            ,   u'retries:     %d after deadlocks' % self.retries
+        ])
+
+    def __str__(self):
+        return unicode(self).encode('utf8', 'replace')
+
+def runWorkers(target, arguments, workers, duration, calls, deadlock_retries):
+    """Calls `target` from `workers` threads, see :func:`runLoadTest`."""
+    counter  = itertools.count()
+    lock     = threading.Lock()
+    report   = LoadTestReport()
+    start    = time.time()
+    deadline = None if duration is None else start + duration
+
+    def work():
+        latencies = []
+        errors = warnings = retries = 0
+
+        while True:
+            index = next(counter)
+
+            if (calls is not None and index >= calls) or (deadline is not None and time.time() >= deadline):
+                break
+
+            args, kwargs = splitArguments(arguments(index) if callable(arguments) else arguments)
+            began = time.time()
+
+            for attempt in xrange(deadlock_retries + 1):
+                try:
+                    target(*args, **kwargs)
+                except (ProcedureExecutionWarnings, RawSQLWarning):
+                    warnings += 1
+                except Exception as exp:
+                    if errorCode(exp) == ER_LOCK_DEADLOCK and attempt < deadlock_retries:
+                        retries += 1
+                        continue
+
+                    errors += 1
+
+                break
+
+            latencies.append(time.time() - began)
+
+        with lock:
+            report.merge(LoadTestReport(latencies, errors, warnings, retries))
+
+    threads = [threading.Thread(target = work) for _ in xrange(workers)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    report.elapsed = time.time() - start
+
+    return report
+
+def runProcessWorker(name, arguments, duration, calls, deadlock_retries, fakeConnection):
+    """Runs a single worker in a separate process, the target is looked up in the library by name."""
+    with usingConnection(fakeConnection):
+        return runWorkers(library[name], arguments, 1, duration, calls, deadlock_retries)
+
+def runLoadTest(target, arguments = None, workers = 4, duration = None, calls = None, processes = False, deadlock_retries = 3, fakeConnection = None):
+    """Calls a stored procedure or raw SQL concurrently, and reports how it holds up.
+
+:param target: a :class:`~procedure.StoredProcedure` or :class:`~sql.SQL` object, or the name of a procedure registered with the library.
+:param arguments: the arguments of each call: a list (used as positional arguments), a dictionary (used as keyword arguments), or a function which is given the number of the call and returns one of these (default is no arguments).
+:param workers: the number of threads, or processes, making calls (default is 4).
+:param duration: the number of seconds to keep calling (default is no limit).
+:param calls: the total number of calls to make (default is no limit).
+:param processes: whether to make calls from separate processes instead of threads. The target must then be given by name, and the arguments must be picklable (default is `False`).
+:param deadlock_retries: the number of times a call is retried after a deadlock (default is 3).
+:param fakeConnection: a :class:`FakeConnection` to use instead of the database, to measure the overhead of this library itself (default is `None`).
+:returns: a :class:`LoadTestReport`.
+:raises: :exc:`ValueError` when neither `duration` nor `calls` is given, or when using processes with a target that is not a name."""
+    if duration is None and calls is None:
+        raise ValueError('Either a duration or a number of calls is needed')
+
+    if not processes:
+        if isinstance(target, basestring):
+            target = library[target]
+
+        with usingConnection(fakeConnection):
+            return runWorkers(target, arguments, workers, duration, calls, deadlock_retries)
+
+    if not isinstance(target, basestring):
+        raise ValueError('Load testing from separate processes needs the name of a registered procedure')
+
+    # Divide the calls among the processes
+    share = [None] * workers if calls is None else \
+        [calls // workers + (1 if index < calls % workers else 0) for index in xrange(workers)]
+
+    from multiprocessing import Pool
+
+    pool = Pool(workers)
+
+    try:
+        results = [
+                pool.apply_async(runProcessWorker, (target, arguments, duration, share[index], deadlock_retries, fakeConnection))
+            for index in xrange(workers)
+        ]
+        reports = [result.get() for result in results]
+    finally:
+        pool.close()
+        pool.join()
+
+    report = LoadTestReport()
+
+    for other in reports:
+        report.merge(other)
+
+    return report
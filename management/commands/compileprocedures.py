@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+from optparse import make_option
+
+from stored_procedures.library import library
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option('--output'
+                ,   dest    = 'output'
+                ,   default = 'procedures.sql'
+                ,   help    = 'File to write the bundle of procedures to (default is procedures.sql)'
+            )
+        ,   make_option('--manifest'
+                ,   dest    = 'manifest'
+                ,   default = None
+                ,   help    = 'File to write the manifest to (default is the bundle\'s filename followed by .json)'
+            )
+    )
+    help = 'Renders all registered stored procedures into a single SQL bundle, which can be deployed with the mysql client, and a manifest describing it.'
+
+    def handle(self, *args, **options):
+        output   = options['output']
+        manifest = options['manifest'] or output + '.json'
+
+        # Import all models, which registers the procedures defined alongside them
+        models.get_models()
+
+        manifest = library.compileBundle(output, manifest)
+
+        if int(options.get('verbosity', 1)) >= 1:
+            self.stdout.write('Wrote %d procedures to %s\n' % (len(manifest['procedures']), output))
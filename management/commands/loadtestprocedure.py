@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from optparse import make_option
+import json
+
+from stored_procedures.library import library
+from stored_procedures.loadtest import runLoadTest, FakeConnection
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option('--workers'
+                ,   dest    = 'workers'
+                ,   type    = 'int'
+                ,   default = 4
+                ,   help    = 'Number of threads, or processes, calling the procedure (default is 4)'
+            )
+        ,   make_option('--duration'
+                ,   dest    = 'duration'
+                ,   type    = 'float'
+                ,   default = None
+                ,   help    = 'Number of seconds to keep calling the procedure'
+            )
+        ,   make_option('--calls'
+                ,   dest    = 'calls'
+                ,   type    = 'int'
+                ,   default = None
+                ,   help    = 'Total number of calls to make'
+            )
+        ,   make_option('--processes'
+                ,   action  = 'store_true'
+                ,   dest    = 'processes'
+                ,   default = False
+                ,   help    = 'Call from separate processes instead of threads'
+            )
+        ,   make_option('--arguments'
+                ,   dest    = 'arguments'
+                ,   default = None
+                ,   help    = 'Arguments of each call, as a JSON list or object'
+            )
+        ,   make_option('--fake'
+                ,   action  = 'store_true'
+                ,   dest    = 'fake'
+                ,   default = False
+                ,   help    = 'Do not use the database, to measure the overhead of the library itself'
+            )
+        ,   make_option('--fake-latency'
+                ,   dest    = 'fake_latency'
+                ,   type    = 'float'
+                ,   default = 0
+                ,   help    = 'Number of seconds each call takes when not using the database (default is 0)'
+            )
+    )
+    args = '<procedure name>'
+    help = 'Calls a registered stored procedure concurrently, and reports its throughput, latency, errors, warnings and deadlock retries.'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give the name of exactly one procedure')
+
+        # Import all models, which registers the procedures defined alongside them
+        models.get_models()
+
+        name = args[0]
+
+        if not name in library:
+            raise CommandError('There is no procedure named %s' % name)
+
+        try:
+            report = runLoadTest(
+                    name
+                ,   arguments       = None if options['arguments'] is None else json.loads(options['arguments'])
+                ,   workers         = options['workers']
+                ,   duration        = options['duration']
+                ,   calls           = options['calls']
+                ,   processes       = options['processes']
+                ,   fakeConnection  = FakeConnection(latency = options['fake_latency']) if options['fake'] else None
+            )
+        except ValueError as exp:
+            raise CommandError(exp)
+
+        self.stdout.write('%s\n' % report)
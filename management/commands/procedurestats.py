@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from optparse import make_option
+import time
+
+from stored_procedures.exceptions import StatisticsUnavailableException
+from stored_procedures.serverstats import takeSnapshot
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option('--interval'
+                ,   dest    = 'interval'
+                ,   type    = 'float'
+                ,   default = None
+                ,   help    = 'Number of seconds to gather statistics over (default is all statistics since the server started)'
+            )
+        ,   make_option('--statements'
+                ,   dest    = 'statements'
+                ,   action  = 'store_true'
+                ,   default = False
+                ,   help    = 'Also show the statements within each procedure, from the history of recent statements'
+            )
+        ,   make_option('--concerning'
+                ,   dest    = 'concerning'
+                ,   action  = 'store_true'
+                ,   default = False
+                ,   help    = 'Only show the procedures which may need rewriting'
+            )
+    )
+    help = 'Shows the server-side statistics of all registered stored procedures, as gathered by performance_schema: the time spent in them, the rows they examined and sent, and their temporary tables and sorts.'
+
+    def handle(self, *args, **options):
+        # Import all models, which registers the procedures defined alongside them
+        models.get_models()
+
+        try:
+            before = None
+
+            if options['interval'] is not None:
+                before = takeSnapshot()
+                time.sleep(options['interval'])
+
+            report = takeSnapshot(statements = options['statements'], since = before).diff(before)
+        except StatisticsUnavailableException as exp:
+            raise CommandError(unicode(exp))
+
+        if options['concerning']:
+            report.programs = report.concerning
+
+        self.stdout.write('%s\n' % report)
@@ -0,0 +1,105 @@
+import threading
+
+# The stack of scopes of each thread
+_state = threading.local()
+
+class MemoizationScope():
+    def __init__(self):
+        """A unit of work, such as a web request, within which the results of stored procedures and raw SQL are memoized by their arguments.
+
+Use it as a context manager; scopes can be nested, in which case only the innermost one is used. Within a scope:
+
+* a call that reads data yields the result of an earlier call with the same arguments, whenever there is one;
+* a call that writes data is always executed, and afterwards empties the scope, as well as the scopes it is nested in;
+* saving or deleting a django model forgets the results of all procedures that refer to this model (by means of `[app.Model]`), in all scopes.
+
+Memoized results are shared, so they should not be modified."""
+        self._results = dict()
+
+    def __enter__(self):
+        if not hasattr(_state, 'scopes'):
+            _state.scopes = []
+
+        _state.scopes.append(self)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self in _state.scopes:
+            _state.scopes.remove(self)
+
+        self.clear()
+
+        return False
+
+    def clear(self):
+        """Forgets all memoized results."""
+        self._results.clear()
+
+    def forgetModel(self, label):
+        """Forgets the results of all procedures which refer to the model with the given label, `app.Model`."""
+        for owner in list(self._results):
+            if label in owner.dependencies:
+                del self._results[owner]
+
+    def memoize(self, owner, key, function):
+        """Gives the result of `function()`, or the result memoized for `owner` and the hashable `key`."""
+        results = self._results.setdefault(owner, dict())
+
+        try:
+            return results[key]
+        except KeyError:
+            result = results[key] = function()
+
+            return result
+
+def currentScope():
+    """Gives the innermost :class:`MemoizationScope` of the current thread, or `None` when there is none."""
+    scopes = getattr(_state, 'scopes', None)
+
+    return scopes[-1] if scopes else None
+
+def openScopes():
+    """Gives the :class:`MemoizationScope` instances of the current thread, from the outermost to the innermost."""
+    return list(getattr(_state, 'scopes', ()))
+
+def memoize(owner, key, function):
+    """Gives the result of `function()`, memoized within the current scope, if any. The `owner` is the stored procedure or raw SQL being called, and `key` its arguments, see :class:`MemoizationScope`."""
+    scope = currentScope()
+
+    if scope is None:
+        return function()
+
+    if owner.writes:
+        return unmemoized(owner, function)
+
+    try:
+        hash(key)
+    except TypeError:
+        # Unhashable arguments can not be memoized
+        return function()
+
+    return scope.memoize(owner, key, function)
+
+def unmemoized(owner, function):
+    """Gives the result of `function()`, which is not memoized, for example because it is a cursor or a stream. When the `owner` writes data, all scopes of the current thread are emptied afterwards, see :class:`MemoizationScope`."""
+    try:
+        return function()
+    finally:
+        if owner.writes:
+            for scope in openScopes():
+                scope.clear()
+
+def modelChanged(sender, **kwargs):
+    """Forgets the results depending on the saved or deleted model in all scopes."""
+    for scope in openScopes():
+        scope.forgetModel('%s.%s' % (sender._meta.app_label, sender.__name__))
+
+# Connect to django's handlers of changed models
+try:
+    from django.db.models.signals import post_save, post_delete
+
+    post_save.connect(modelChanged)
+    post_delete.connect(modelChanged)
+except ImportError:
+    pass
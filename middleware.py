@@ -0,0 +1,14 @@
+from memoization import MemoizationScope
+
+class MemoizationMiddleware(object):
+    """Memoizes the results of stored procedures and raw SQL within each request, see :class:`~memoization.MemoizationScope`."""
+    def process_request(self, request):
+        request.stored_procedures_scope = MemoizationScope().__enter__()
+
+    def process_response(self, request, response):
+        scope = getattr(request, 'stored_procedures_scope', None)
+
+        if scope is not None:
+            scope.__exit__(None, None, None)
+
+        return response
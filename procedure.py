@@ -5,19 +5,50 @@ try:
 except ImportError as exp:
     print exp
 
-from django.template import Template, Context
 from _mysql import OperationalError
 
-import codecs, itertools, re, functools, warnings
+import codecs, itertools, functools, hashlib, re, time, warnings
 
 from exceptions import *
-from library import registerProcedure
-
-IN_OUT_STRING  = '(IN)|(OUT)|(INOUT)'
-argumentString = r'(?P<inout>' + IN_OUT_STRING + ')\s*(?P<name>[\w_]+)\s+(?P<type>.+?(?=(,\s*' + IN_OUT_STRING + ')|$))'
-argumentParser = re.compile(argumentString, re.DOTALL)
-
-methodParser = re.compile(r'CREATE\s+PROCEDURE\s+(?P<name>[\w_]+)\s*\(\s*(?P<arguments>.*)\)[^\)]*BEGIN', re.DOTALL)
+from library import registerProcedure, library
+from watchdog import QueryWatchdog
+from tokenizer import parseHeader, ParseError
+from rows import RowFactory, ROW_TYPES
+from cursors import unbufferedCursor, discardCursor, DATABASE_ERRORS
+from columns import FETCH_SIZE
+from limiter import ConcurrencyLimiter, NORMAL
+from coalescing import CallCoalescer
+from memoization import memoize, unmemoized
+from instances import ModelFactory
+
+# Options that can be given to a single call, see StoredProcedure.withOptions
+CALL_OPTIONS = frozenset(['timeout', 'priority'])
+
+# MySQL error codes which are handled explicitly
+ER_SP_ALREADY_EXISTS = 1304
+ER_SP_DOES_NOT_EXIST = 1305
+ER_SP_WRONG_NO_OF_ARGS = 1318
+
+# Versioned deployment, see StoredProcedure.versionName: the number of digits of
+# the checksum in the name of a version, the longest name MySQL allows, and the
+# comment marking versions that are no longer current
+VERSION_LENGTH = 10
+MAX_NAME_LENGTH = 64
+
+# Names too long to precede the checksum are shortened, keeping this many digits
+# of the digest of the full name to keep them apart
+NAME_DIGEST_LENGTH = 8
+SUPERSEDED = 'superseded'
+
+VERSIONS_QUERY = '''
+    SELECT ROUTINE_NAME, ROUTINE_COMMENT = %s, LAST_ALTERED < NOW() - INTERVAL %s SECOND
+    FROM information_schema.ROUTINES
+    WHERE ROUTINE_SCHEMA = DATABASE() AND ROUTINE_TYPE = %s AND ROUTINE_NAME LIKE %s
+'''
+
+def validTimeout(timeout):
+    """Whether `timeout` is a valid time limit: either `None` or a positive number of seconds."""
+    return timeout is None or (isinstance(timeout, (int, long, float)) and not isinstance(timeout, bool) and timeout > 0)
 
 class StoredProcedure():
     def __init__(
@@ -29,6 +60,14 @@ class StoredProcedure():
             ,   flatten         = True
             ,   context         = None
             ,   raise_warnings  = False
+            ,   timeout         = None
+            ,   raw_sql         = None
+            ,   rows            = 'tuple'
+            ,   concurrency     = None
+            ,   priority        = NORMAL
+            ,   coalesce        = False
+            ,   writes          = None
+            ,   model           = None
     ):
         """Make a wrapper for a stored procedure
 
@@ -43,7 +82,21 @@ class StoredProcedure():
 :param context: a context (dictionary or function which takes the stored procedure itself and yields a dictionary) for rendering the procedure (default is empty)
 :param raise_warnings: whether warnings should be raised as an exception (default is false)
 :type raise_warnings: bool
-:raises: :exc:`~exceptions.InitializationException` in case one of the arguments does not satisfy the above description or :exc:`~exceptions.FileDoesNotWorkException` in case :meth:`~procedure.StoredProcedure.readProcedure` fails. If you can not differentiate between these errors in handling them (as would be most common), simply check for :exc:`~exceptions.ProcedureConfigurationException`, as this is a parent of both.
+:param timeout: the number of seconds a call may take before it is cancelled in the database, `None` means no limit (default is `None`). See :meth:`~procedure.StoredProcedure.withOptions` for overriding this for a single call.
+:type timeout: `int` or `float`
+:param raw_sql: the procedure's content; when given, `filename` is not read but only used to identify the procedure (default is `None`)
+:type raw_sql: str or unicode
+:param rows: the kind of rows in the resultset, either `'tuple'`, `'named'` for tuples whose values can also be accessed as attributes named after the columns, or `'columns'` for a dictionary of column arrays, see :class:`~rows.RowFactory` (default is `'tuple'`). Columns are fetched in chunks from an unbuffered cursor and are never flattened.
+:type rows: str
+:param concurrency: limits the number of calls running at the same time: either a number, a :class:`~limiter.ConcurrencyLimiter`, which may be shared by several procedures, or the name of a group of procedures configured in the setting `STORED_PROCEDURES_CONCURRENCY` (see :meth:`~library.StoredProcedureLibary.limiter`). Calls beyond the limit wait in a queue, and are rejected with :exc:`~exceptions.ProcedureRejectedException` when it is full (default is `None`, no limit).
+:param priority: the priority of calls waiting in the queue, see :mod:`~limiter` (default is :data:`~limiter.NORMAL`).
+:type priority: int
+:param coalesce: whether concurrent calls with the same arguments and call options share a single execution, see :class:`~coalescing.CallCoalescer`. A call waiting for an identical one still observes its own time limit. Only use this for procedures that do not modify data. Callers then share the same results, which should not be modified (default is `False`).
+:type coalesce: bool
+:param writes: whether the procedure modifies data. Within a :class:`~memoization.MemoizationScope`, results of procedures that do not are memoized, and calls to procedures that do empty the scope (default is `None`: the procedure is taken to modify data unless it is declared `READS SQL DATA` or `NO SQL`).
+:type writes: bool
+:param model: a django model, or its label `'app.Model'`, whose instances the rows in the resultset are, see :class:`~instances.ModelFactory`. Instances are only built when they are accessed, and fields absent from the results are deferred. Only possible with `rows = 'tuple'` (default is `None`, no model).
+:raises: :exc:`~exceptions.InitializationException` in case one of the arguments does not satisfy the above description. When the procedure is first used, :exc:`~exceptions.FileDoesNotWorkException` is raised in case :meth:`~procedure.StoredProcedure.readProcedure` fails. If you can not differentiate between these errors in handling them (as would be most common), simply check for :exc:`~exceptions.ProcedureConfigurationException`, as this is a parent of both.
 
 This provides a wrapper for stored procedures. Given the location of a stored procedure, this wrapper can automatically infer its arguments and name. Consequently, one can call the wrapper as if it were a function, using these arguments as keyword arguments, resulting in calling the stored procedure.
 
@@ -52,22 +105,32 @@ By default, the stored procedure will be stored in the database (replacing any s
 It is possible to refer to models and columns of models from within the stored procedure in the following sense. If in the application "shop" one has a model named "Stock", then writing [shop.Stock] in the file describing the stored procedure will yield a the database-name of the model Stock. If this model has a field "shelf", then [shop.Stock.shelf] will yield the field's database name. As a shortcut, one can also use [shop.Stock.pk] to refer to the primary key of Stock. All these names are escaped appropriately.
 
 Moreover, one can use django templating language in the stored procedure. The argument `context` is fed to this template.
+
+Defining a stored procedure does not touch the filesystem or the database: the file is only read, and its name and arguments only inferred, when the procedure is first used. Hence, procedures can be defined at the module level without slowing down the import of that module.
 """
         # Save settings
         self._filename = filename
         self._flatten = flatten
         self._raise_warnings = raise_warnings
 
-        self.raw_sql = self.readProcedure()
+        # The procedure's content is read when first needed, see raw_sql
+        self._raw_sql = raw_sql
 
-        # When we are forced to check for the procedures name, this already
-        # gives us the argument-data needed to process the arguments, so save
-        # this in case we need it later on
-        argumentContent = None
+        # The rendered procedure, see renderProcedure
+        self.sql = None
+        self.checksum = None
+        self._prerendered = False
 
-        # Determine name of the procedure
+        # The background deployment storing this procedure, if any
+        self._deployment = None
+
+        # The header of the procedure is parsed when first needed, see _parsed_header
+        self._header = None
+        self._headerParsed = False
+
+        # Determine name of the procedure, it is inferred when first needed
         if name is None:
-            argumentContent = self._generate_name()
+            self._name = None
         elif isinstance(name, str):
             self._name = name.decode('utf-8')
         elif isinstance(name, unicode):
@@ -80,11 +143,12 @@ Moreover, one can use django templating language in the stored procedure. The ar
                 ,   field_value = name
             )
 
-        # Determine the procedures arguments
-        if arguments is None:
-            self._generate_arguments(argumentContent)
-        elif isinstance(arguments, list):
-           self._generate_shuffle_arguments(arguments)
+        # Determine the procedures arguments, they are inferred when first needed
+        self._arguments = None
+        self._shuffle_arguments = None
+
+        if arguments is None or isinstance(arguments, list):
+            self._givenArguments = arguments
         else:
             raise InitializationException(
                     procedure   = self
@@ -93,7 +157,8 @@ Moreover, one can use django templating language in the stored procedure. The ar
                 ,   field_value = arguments
             )
 
-        # Determine whether the procedure should return any results
+        # Determine whether the procedure should return any results, a function
+        # always does, see hasResults
         if isinstance(results, bool):
             self._hasResults = results
         elif results is None:
@@ -119,6 +184,84 @@ Moreover, one can use django templating language in the stored procedure. The ar
                 ,   field_value = context
             )
 
+        # Determine the time limit of a call
+        if validTimeout(timeout):
+            self._timeout = timeout
+        else:
+            raise InitializationException(
+                    procedure   = self
+                ,   field_name  = 'timeout'
+                ,   field_types = (None, int, float)
+                ,   field_value = timeout
+            )
+
+        # Determine the kind of rows in the results
+        if rows in ROW_TYPES:
+            self._rowFactory = RowFactory(rows)
+        else:
+            raise InitializationException(
+                    procedure   = self
+                ,   field_name  = 'rows'
+                ,   field_types = ROW_TYPES
+                ,   field_value = rows
+            )
+
+        # Determine the model of the rows in the results, if any
+        if model is None:
+            pass
+        elif rows == 'tuple' and ((isinstance(model, basestring) and '.' in model) or hasattr(model, '_meta')):
+            self._rowFactory = ModelFactory(self, model)
+        else:
+            raise InitializationException(
+                    procedure   = self
+                ,   field_name  = 'model'
+                ,   field_types = (None, 'model', 'app.Model')
+                ,   field_value = model
+            )
+
+        # Determine how many calls may run at the same time
+        if concurrency is None or isinstance(concurrency, ConcurrencyLimiter):
+            self._limiter = concurrency
+        elif isinstance(concurrency, (int, long)) and concurrency > 0:
+            # The name may only be known once the procedure's file is read
+            self._limiter = ConcurrencyLimiter(concurrency, name = lambda: self.name)
+        elif isinstance(concurrency, basestring):
+            self._limiter = library.limiter(concurrency, procedure = self)
+        else:
+            raise InitializationException(
+                    procedure   = self
+                ,   field_name  = 'concurrency'
+                ,   field_types = (None, int, ConcurrencyLimiter, str)
+                ,   field_value = concurrency
+            )
+
+        self._priority = priority
+
+        # Determine whether identical concurrent calls are coalesced
+        if isinstance(coalesce, bool):
+            self._coalescer = CallCoalescer() if coalesce else None
+        else:
+            raise InitializationException(
+                    procedure   = self
+                ,   field_name  = 'coalesce'
+                ,   field_types = (bool,)
+                ,   field_value = coalesce
+            )
+
+        # Determine whether the procedure modifies data, it is inferred when first
+        # needed, see writes
+        if writes is None or isinstance(writes, bool):
+            self._writes = writes
+        else:
+            raise InitializationException(
+                    procedure   = self
+                ,   field_name  = 'writes'
+                ,   field_types = (None, bool)
+                ,   field_value = writes
+            )
+
+        self._dependencies = None
+
         # Register the procedure
         registerProcedure(self)
 
@@ -141,13 +284,10 @@ Moreover, one can use django templating language in the stored procedure. The ar
 
         return fileHandler.read()
 
-    def renderProcedure(self, library):
-        """Renders the stored procedure.
-
-:param library: The library that contains the table information.
-:raises: :exc:`~exceptions.ProcedureContextException` when the dynamic context's construction yields an :exc:`Exception`. When a reference to a table or column within the raw procedure does not exist, :exc:`~exceptions.ProcedureKeyException` is raised.
+    def renderingContext(self):
+        """Gives the context the procedure is rendered with: the context given on initialization, computed when it is dynamic, with 'name' set to the (escaped) name of the stored procedure.
 
-Whenever the context given on initialization is dynamic, it is computed here. First, the SQL will be treated as a django-template with as context the given context and 'name' set to the (escaped) name of the stored procedure. Next, references to tables and columns will be replaced. This depends on the library in use, which carries information about which tables exist. The default library in library almost always suffices."""
+:raises: :exc:`~exceptions.ProcedureContextException` when the dynamic context's construction yields an :exc:`Exception`."""
         # Determine context of the procedure
         renderContext = \
             {
@@ -170,20 +310,48 @@ Whenever the context given on initialization is dynamic, it is computed here. Fi
 
             renderContext.update(context)
 
+        return renderContext
+
+    def renderProcedure(self, library):
+        """Renders the stored procedure.
+
+:param library: The library that contains the table information.
+:raises: :exc:`~exceptions.ProcedureContextException` when the dynamic context's construction yields an :exc:`Exception`. When a reference to a table or column within the raw procedure does not exist, :exc:`~exceptions.ProcedureKeyException` is raised.
+
+Whenever the context given on initialization is dynamic, it is computed here, see :meth:`~procedure.StoredProcedure.renderingContext`. First, the SQL will be treated as a django-template with this context. Next, references to tables and columns will be replaced. This depends on the library in use, which carries information about which tables exist. The default library in library almost always suffices. The result is stored in `sql`, and its SHA-1 digest in `checksum`."""
+        renderContext = self.renderingContext()
+
         # Render SQL
+        # Importing django's templates takes long, so only do so when rendering
+        from django.template import Template, Context
+
         sqlTemplate = Template(self.raw_sql)
-        preprocessed_sql = sqlTemplate.render(Context(renderContext))
+        preprocessed_sql = sqlTemplate.render(Context(renderContext, autoescape = False))
 
         # Fill in actual names
-        self.sql = library.replaceNames(
-                self.raw_sql
+        self.setRendered(library.replaceNames(
+                preprocessed_sql
             ,   functools.partial(ProcedureKeyException, procedure = self)
-        )
+        ))
+
+    def setRendered(self, sql, prerendered = False):
+        """Sets the rendered procedure.
+
+:param sql: the rendered procedure, as :meth:`~procedure.StoredProcedure.renderProcedure` would have produced it. Trailing whitespace and semicolons are stripped.
+:param prerendered: whether the procedure was rendered elsewhere, for example in a bundle (see :meth:`~library.StoredProcedureLibary.loadBundle`), so that :meth:`~procedure.StoredProcedure.resetProcedure` need not render it again."""
+        # Trailing whitespace and semicolons do not change the procedure, but
+        # would change its checksum, and so the name of its version
+        sql = sql.rstrip().rstrip(';').rstrip()
+
+        self.sql = sql
+        self.checksum = hashlib.sha1(sql.encode('utf-8')).hexdigest()
+        self._prerendered = prerendered
 
     def resetProcedure(self, library, verbosity = 2):
-        """Renders the procedure and stores it in the database. See :meth:`~procedure.StoredProcedure.renderProcedure` and :meth:`~procedure.StoredProcedure.send_to_database` for details."""
+        """Renders the procedure and stores it in the database. See :meth:`~procedure.StoredProcedure.renderProcedure` and :meth:`~procedure.StoredProcedure.send_to_database` for details. A procedure taken from a bundle is not rendered again."""
         # Render the procedure
-        self.renderProcedure(library)
+        if not self._prerendered:
+            self.renderProcedure(library)
 
         # Store the procedure in the database
         self.send_to_database(verbosity)
@@ -195,6 +363,8 @@ Whenever the context given on initialization is dynamic, it is computed here. Fi
 :raises: :exc:`~exceptions.ProcedureCreationException` in case of database errors.
 
 Note that we first try to delete the procedure, and then insert it. Take great care not to accidentally delete some other procedure which just happens to carry the same name, this is *not* prevented here.
+
+When deploying versioned (see :attr:`~procedure.StoredProcedure.versioned`), nothing is deleted. Instead, the procedure is created under its :attr:`~procedure.StoredProcedure.versionName`, unless that version already exists, and all other versions are marked as superseded. Calls in this process then switch to the new version at once; superseded versions are dropped by :meth:`~procedure.StoredProcedure.collectVersions`.
 """
         cursor = connection.cursor()
 
@@ -206,8 +376,11 @@ Note that we first try to delete the procedure, and then insert it. Take great c
                 # When sufficiently verbose or pedantic, display warnings
                 warnings.simplefilter('always' if verbosity >= 2 or self._raise_warnings else 'ignore')
 
-                cursor.execute('DROP PROCEDURE IF EXISTS %s' % connection.ops.quote_name(self.name))
-                cursor.execute(self.sql)
+                if self.versioned:
+                    self._store_version(cursor)
+                else:
+                    cursor.execute('DROP %s IF EXISTS %s' % (self.kind, connection.ops.quote_name(self.name)))
+                    cursor.execute(self.sql)
 
                 if len(ws) >= 1:
                     print "Warning during creation of %s" % self
@@ -223,10 +396,166 @@ Note that we first try to delete the procedure, and then insert it. Take great c
 
         cursor.close()
 
+        # Switch calls over to the version just stored
+        if self.versioned:
+            self._generate_call(len(self.arguments))
+
+    def versionedStatement(self):
+        """Gives the rendered procedure, creating its current version (see :attr:`~procedure.StoredProcedure.versionName`) rather than the procedure itself, together with the start and end of the name of the version within it.
+
+:raises: :exc:`~exceptions.ProcedureNotParsableException` when the rendered procedure could not be parsed."""
+        header = self._rendered_header()
+        name = connection.ops.quote_name(self.versionName)
+
+        return (self.sql[:header.name_start] + name + self.sql[header.name_end:], header.name_start, header.name_start + len(name))
+
+    def _rendered_header(self):
+        """Gives the parsed header of the rendered procedure, see :func:`~tokenizer.parseHeader`."""
+        try:
+            return parseHeader(self.sql)
+        except ParseError:
+            raise ProcedureNotParsableException(
+                procedure = self
+            )
+
+    def _store_version(self, cursor):
+        """Creates the current version of the procedure, unless it exists already, and marks all other versions as superseded."""
+        quote = connection.ops.quote_name
+        version = self.versionName
+        header = self._rendered_header()
+
+        versions = self._stored_versions(cursor)
+
+        if not version.lower() in [name.lower() for (name, _, _) in versions]:
+            try:
+                cursor.execute(self.versionedStatement()[0])
+            except DATABASE_ERRORS as exp:
+                # Another process deploying at the same time may have just
+                # created this version, which is identical by its checksum
+                if (exp.args[0] if len(exp.args) > 0 else None) != ER_SP_ALREADY_EXISTS:
+                    raise
+
+        for name, superseded, _ in versions:
+            if name.lower() == version.lower():
+                # Going back to an earlier version, restore its comment
+                if superseded:
+                    comment = [characteristic for characteristic in header.characteristics if characteristic.startswith('COMMENT ')]
+                    cursor.execute('ALTER %s %s %s' % (self.kind, quote(name), comment[0] if comment else "COMMENT ''"))
+            elif not superseded:
+                cursor.execute('ALTER %s %s COMMENT %%s' % (self.kind, quote(name)), [SUPERSEDED])
+
+    def _stored_versions(self, cursor, grace = 0):
+        """Gives a list of the versions of the procedure in the database, as tuples of their name, whether they are superseded, and whether they were last altered more than `grace` seconds ago."""
+        prefix = self.versionPrefix
+        pattern = prefix.replace('\\', '\\\\').replace('_', '\\_').replace('%', '\\%') + '%'
+        versionParser = re.compile(re.escape(prefix) + '[0-9a-f]{%d}$' % VERSION_LENGTH, re.IGNORECASE)
+
+        cursor.execute(VERSIONS_QUERY, [SUPERSEDED, grace, self.kind, pattern])
+
+        return [
+                (name, bool(superseded), bool(expired))
+            for (name, superseded, expired) in cursor.fetchall()
+            if versionParser.match(name)
+        ]
+
+    def collectVersions(self, grace, verbosity = 2):
+        """Drops the versions of the procedure which were superseded more than `grace` seconds ago, see :meth:`~procedure.StoredProcedure.send_to_database`. Processes still running an earlier version of the code keep calling that version until then.
+
+:returns: the names of the versions dropped.
+:raises: :exc:`~exceptions.ProcedureCreationException` in case of database errors."""
+        quote = connection.ops.quote_name
+        version = self.versionName.lower()
+        dropped = []
+
+        cursor = connection.cursor()
+
+        try:
+            for name, superseded, expired in self._stored_versions(cursor, grace):
+                if superseded and expired and name.lower() != version:
+                    cursor.execute('DROP %s IF EXISTS %s' % (self.kind, quote(name)))
+                    dropped.append(name)
+        except (DatabaseError, OperationalError) as exp:
+            raise ProcedureCreationException(
+                    procedure         = self
+                ,   operational_error = exp
+            )
+
+        cursor.close()
+
+        if verbosity >= 2 and dropped:
+            print 'Dropped the superseded versions %s of %s' % (', '.join(dropped), self)
+
+        return dropped
+
     def __call__(self, *args, **kwargs):
         """Call the stored procedure. Arguments and keyword arguments to this method are fed to the stored procedure. First, all arguments are used, and then the keyword arguments are filled in.
 
-:raises: Nameclashes result in a :exc:`TypeError`, invalid arguments yield :exc:`~exceptions.InvalidArgument` and too few arguments give rise to :exc:`~exceptions.InsufficientArguments`."""
+:raises: Nameclashes result in a :exc:`TypeError`, invalid arguments yield :exc:`~exceptions.InvalidArgument` and too few arguments give rise to :exc:`~exceptions.InsufficientArguments`. When the call exceeds its time limit, :exc:`~exceptions.ProcedureTimeoutException` is raised."""
+        return self._execute(args, kwargs, {})
+
+    def withOptions(self, **options):
+        """Gives a function which calls the stored procedure exactly like :meth:`~procedure.StoredProcedure.__call__`, but with the given options for this call only. For example, ``procedure.withOptions(timeout = 2)(product = 'Tomato')``.
+
+:param timeout: the number of seconds this call may take, overriding the time limit given on initialization. After this time the running statement is cancelled in the database (by means of `KILL QUERY`) and :exc:`~exceptions.ProcedureTimeoutException` is raised.
+:param priority: the priority of this call when it has to wait for the concurrency limit, overriding the priority given on initialization.
+:raises: :exc:`TypeError` when an unknown option is given, or when the timeout is not `None` or a positive number."""
+        for option in options:
+            if not option in CALL_OPTIONS:
+                raise TypeError('Unknown call option %s' % option)
+
+        if not validTimeout(options.get('timeout')):
+            raise TypeError('The timeout should be None or a positive number of seconds, not %r' % (options['timeout'],))
+
+        def call(*args, **kwargs):
+            return self._execute(args, kwargs, options)
+
+        return call
+
+    def _execute(self, args, kwargs, options):
+        """Performs a call to the stored procedure with the given options, see :meth:`~procedure.StoredProcedure.__call__`."""
+        args = self._collect_arguments(args, kwargs)
+
+        return memoize(self, tuple(args), functools.partial(self._coalesced, args, options))
+
+    def _coalesced(self, args, options):
+        """Performs a call to the stored procedure with the ordered list of values `args`, shared with identical concurrent calls if so requested."""
+        if self._coalescer is not None:
+            key = (tuple(args), tuple(sorted(options.iteritems())))
+            timeout = options.get('timeout', self._timeout)
+
+            try:
+                hash(key)
+            except TypeError:
+                # Unhashable arguments can not be coalesced
+                pass
+            else:
+                return self._coalescer.call(
+                        key
+                    ,   functools.partial(self._call_once, args, options)
+                    ,   timeout = timeout
+                    ,   expired = functools.partial(
+                                ProcedureTimeoutException
+                            ,   procedure         = self
+                            ,   operational_error = 'Gave up waiting for an identical call in progress'
+                            ,   timeout           = timeout
+                        )
+                )
+
+        return self._call_once(args, options)
+
+    def _call_once(self, args, options):
+        """Performs a single call to the stored procedure with the ordered list of values `args`."""
+        if not self.hasResults:
+            self._run(args, options)
+            return
+
+        results = self._run(args, options, self._rowFactory.fetch, self._rowFactory.unbuffered)
+
+        # if so requested, return only the first set of results
+        return results[0] if self._flatten and not self._rowFactory.rows == 'columns' else results
+
+    def _collect_arguments(self, args, kwargs):
+        """Gives the list of values for the arguments of the procedure, in order. The positional arguments `args` come first, the rest is taken from the dictionary `kwargs`, which is emptied."""
         # Fetch the procedures arguments
         for arg, value in itertools.izip(self.arguments, args):
             if arg in kwargs:
@@ -234,114 +563,288 @@ Note that we first try to delete the procedure, and then insert it. Take great c
 
             kwargs[arg] = value
 
-        args = list(self._shuffle_arguments(kwargs))
+        return list(self._shuffle_arguments(kwargs))
 
-        cursor = connection.cursor()
+    def _run(self, args, options, fetch = None, unbuffered = False):
+        """Calls the stored procedure with the ordered list of values `args` and gives the outcome of `fetch(cursor)`, or `None` when nothing is to be fetched. When the results are fetched from an unbuffered cursor, the time limit also covers fetching them.
+
+Waiting for the procedure to be stored in the background, and for a turn from its concurrency limiter, together take no longer than the time limit either."""
+        timeout = options.get('timeout', self._timeout)
+        deadline = None if timeout is None else time.time() + timeout
+
+        # Wait until the procedure has been stored, when this happens in the background
+        deployment = self._deployment
+
+        if deployment is not None and not deployment.wait(self, timeout):
+            raise ProcedureTimeoutException(
+                    procedure         = self
+                ,   operational_error = 'Gave up waiting for the procedure to be stored'
+                ,   timeout           = timeout
+            )
+
+        limiter = self._limiter
+
+        if limiter is None:
+            return self._run_statement(args, options, fetch, unbuffered)
+
+        remaining = None if deadline is None else max(deadline - time.time(), 0)
+
+        if not limiter.acquire(options.get('priority', self._priority), remaining):
+            raise ProcedureRejectedException(
+                    procedure   = self
+                ,   limiter     = limiter
+            )
 
         try:
-            cursor.execute(self.call, args)
-        except (DatabaseError, OperationalError) as exp:
-            # Something went wrong, find out what
-            code, message = exp.args
-            if code == 1305:
-                # Procedure does not exist
-                raise ProcedureDoesNotExistException(
-                        procedure         = self
-                    ,   operational_error = exp
-                )
-            elif code == 1318:
-                # Incorrect number of argument, the argument list must be incorrect
-                raise IncorrectNumberOfArgumentsException(
-                        procedure          = self
-                    ,   operational_error  = exp
-                )
-            else:
-                # Some other error occurred
-                raise ProcedureExecutionException(
-                        procedure         = self
-                    ,   operational_error = exp
-                )
+            return self._run_statement(args, options, fetch, unbuffered)
+        finally:
+            limiter.release()
+
+    def _run_statement(self, args, options, fetch, unbuffered):
+        """Executes the call to the stored procedure, see :meth:`~procedure.StoredProcedure._run`."""
+        cursor = unbufferedCursor() if unbuffered else connection.cursor()
+        results = None
+
+        with QueryWatchdog(options.get('timeout', self._timeout)) as watchdog:
+            try:
+                cursor.execute(self.call, args)
+
+                # Always force the cursor to free its warnings
+                with warnings.catch_warnings(record = True) as ws:
+                    warnings.simplefilter('always' if self._raise_warnings else 'ignore')
+
+                    if fetch is not None:
+                        # There are some results to be fetched
+                        results = fetch(cursor)
+
+                    cursor.close()
+            except DATABASE_ERRORS as exp:
+                discardCursor(cursor)
+                self._raise_execution_error(exp, watchdog)
+            except:
+                # Errors in fetching, such as a failing sink, must not leave
+                # the connection in the middle of a result either
+                discardCursor(cursor)
+                raise
+
+        if len(ws) >= 1:
+            # A warning was raised, raise it whenever the user wants
+            raise ProcedureExecutionWarnings(
+                    procedure   = self
+                ,   warnings    = ws
+            )
 
-        # Always force the cursor to free its warnings
-        with warnings.catch_warnings(record = True) as ws:
-            warnings.simplefilter('always' if self._raise_warnings else 'ignore')
+        return results
 
-            if self.hasResults:
-                # There are some results to be fetched
-                results = cursor.fetchall()
+    def export(self, sink, arguments = None, format = 'csv', progress = None, size = FETCH_SIZE):
+        """Calls the stored procedure and streams its results into `sink`, see :func:`~export.exportRows`.
 
-            cursor.close()
+:param sink: a file-like object, opened in binary mode for the `'columnar'` format.
+:param arguments: the arguments to the procedure, either a list or a dictionary, which are used as arguments and keyword arguments to :meth:`~procedure.StoredProcedure.__call__` respectively (default is no arguments).
+:param format: one of `'csv'`, `'jsonlines'` or `'columnar'` (default is `'csv'`).
+:param progress: a function which is given the number of rows written so far after each chunk (default is `None`).
+:param size: the number of rows held in memory at once (default is :data:`~columns.FETCH_SIZE`).
+:returns: the number of rows written.
 
-            if len(ws) >= 1:
-                # A warning was raised, raise it whenever the user wants
-                raise ProcedureExecutionWarnings(
-                        procedure   = self
-                    ,   warnings    = ws
-                )
+The results are fetched from an unbuffered cursor, so the memory used does not depend on the size of the result."""
+        from export import exportRows
 
-        if self.hasResults:
-            # if so requested, return only the first set of results
-            return results[0] if self._flatten else results
+        if isinstance(arguments, dict):
+            args = self._collect_arguments((), dict(arguments))
+        else:
+            args = self._collect_arguments(arguments or (), dict())
+
+        return unmemoized(self, functools.partial(
+                self._run
+            ,   args
+            ,   options     = {}
+            ,   fetch       = functools.partial(exportRows, sink = sink, format = format, progress = progress, size = size)
+            ,   unbuffered  = True
+        ))
+
+    def _raise_execution_error(self, exp, watchdog):
+        """Translates an error raised by the database during a call into the appropriate exception."""
+        # Something went wrong, find out what
+        code = exp.args[0] if len(exp.args) > 0 else None
+
+        if watchdog.fired:
+            # We cancelled the statement ourselves
+            raise ProcedureTimeoutException(
+                    procedure         = self
+                ,   operational_error = exp
+                ,   timeout           = watchdog.timeout
+            )
+        elif code == ER_SP_DOES_NOT_EXIST:
+            # Procedure does not exist
+            raise ProcedureDoesNotExistException(
+                    procedure         = self
+                ,   operational_error = exp
+            )
+        elif code == ER_SP_WRONG_NO_OF_ARGS:
+            # Incorrect number of argument, the argument list must be incorrect
+            raise IncorrectNumberOfArgumentsException(
+                    procedure          = self
+                ,   operational_error  = exp
+            )
+        else:
+            # Some other error occurred
+            raise ProcedureExecutionException(
+                    procedure         = self
+                ,   operational_error = exp
+            )
 
     # Properties
-    name = property(
-                fget = lambda self: self._name
-            ,   doc  = 'Name of the stored procedure'
-        )
+    @property
+    def raw_sql(self):
+        """The procedure's content, read by means of :meth:`~procedure.StoredProcedure.readProcedure` when first needed"""
+        if self._raw_sql is None:
+            self._raw_sql = self.readProcedure()
+
+        return self._raw_sql
+
+    @property
+    def name(self):
+        """Name of the stored procedure"""
+        if self._name is None:
+            self._generate_name()
+
+        return self._name
 
     filename = property(
                 fget = lambda self: self._filename
             ,   doc  = 'Filename of the stored procedure'
         )
 
-    arguments = property(
-                fget = lambda self: self._arguments
-            ,   doc  = 'Arguments the procedure accepts'
-        )
+    @property
+    def arguments(self):
+        """Arguments the procedure accepts"""
+        self._prepare_arguments()
+
+        return self._arguments
 
     hasResults = property(
-                fget = lambda self: self._hasResults
+                fget = lambda self: self._hasResults or self.kind == 'FUNCTION'
             ,   doc  = 'Whether the stored procedures requires a fetch after execution'
         )
 
-    call       = property(
-                fget  = lambda self: self._call
-            ,   doc   = 'The SQL code needed to call the stored procedure'
+    @property
+    def call(self):
+        """The SQL code needed to call the stored procedure"""
+        self._prepare_arguments()
+
+        return self._call
+
+    kind       = property(
+                fget  = lambda self: 'PROCEDURE' if self._header_or_none() is None else self._header.kind
+            ,   doc   = 'Kind of stored routine, either `PROCEDURE` or `FUNCTION`'
+    )
+
+    characteristics = property(
+                fget  = lambda self: [] if self._header_or_none() is None else self._header.characteristics
+            ,   doc   = 'Characteristics of the stored procedure, such as `MODIFIES SQL DATA`'
+    )
+
+    versioned  = property(
+                fget  = lambda self: getattr(settings, 'STORED_PROCEDURES_VERSIONED', False)
+            ,   doc   = 'Whether the procedure is deployed under a name that changes with each version of its content, as set by the setting `STORED_PROCEDURES_VERSIONED`. All processes should agree on this'
+    )
+
+    @property
+    def versionName(self):
+        """The name of the current version of the procedure when deploying versioned: its name followed by the start of the checksum of its rendered content. The procedure is rendered, when it has not been already, to determine this name."""
+        if self.checksum is None:
+            self.renderProcedure(library)
+
+        return self.versionPrefix + self.checksum[:VERSION_LENGTH]
+
+    @property
+    def versionPrefix(self):
+        """The start of the names of all versions of the procedure, see :attr:`~procedure.StoredProcedure.versionName`. A name that is too long is shortened, and ends in the start of the digest of the full name, so that procedures sharing a long prefix do not share their versions."""
+        name = self.name
+        length = MAX_NAME_LENGTH - VERSION_LENGTH - 2
+
+        if len(name) > length:
+            digest = hashlib.sha1(name.lower().encode('utf-8')).hexdigest()[:NAME_DIGEST_LENGTH]
+            name = '%s_%s' % (name[:length - NAME_DIGEST_LENGTH - 1], digest)
+
+        return '%s__' % name
+
+    limiter    = property(
+                fget  = lambda self: self._limiter
+            ,   doc   = 'The :class:`~limiter.ConcurrencyLimiter` of the stored procedure, or `None` when the number of concurrent calls is not limited'
     )
 
-    def _match_procedure(self):
-        match = methodParser.match(self.raw_sql)
+    @property
+    def writes(self):
+        """Whether the stored procedure modifies data"""
+        if self._writes is None:
+            self._writes = not ('READS SQL DATA' in self.characteristics or 'NO SQL' in self.characteristics)
+
+        return self._writes
+
+    @property
+    def dependencies(self):
+        """The set of models, as `app.Model`, the stored procedure refers to"""
+        if self._dependencies is None:
+            self._dependencies = library.references(self.raw_sql)
+
+        return self._dependencies
+
+    timeout    = property(
+                fget  = lambda self: self._timeout
+            ,   doc   = 'The number of seconds a call may take by default, or `None` when there is no limit'
+    )
+
+    def _header_or_none(self):
+        """Gives the parsed header of the procedure, see :func:`~tokenizer.parseHeader`, or `None` when it could not be parsed. The header is only parsed once."""
+        if not self._headerParsed:
+            try:
+                self._header = parseHeader(self.raw_sql)
+            except ParseError:
+                self._header = None
+
+            self._headerParsed = True
+
+        return self._header
+
+    def _parsed_header(self):
+        """Gives the parsed header of the procedure, see :func:`~tokenizer.parseHeader`.
 
-        if match is None:
+:raises: :exc:`~exceptions.ProcedureNotParsableException` when the header could not be parsed."""
+        if self._header_or_none() is None:
             raise ProcedureNotParsableException(
                 procedure = self
             )
 
-        return match
+        return self._header
 
     def _generate_name(self):
-        match = self._match_procedure()
+        name = self._parsed_header().name
 
-        self._name = match.group('name')
+        # The name may be given by means of a template
+        if name is None:
+            raise ProcedureNotParsableException(
+                procedure = self
+            )
+
+        self._name = name
 
-        return match.group('arguments')
+    def _prepare_arguments(self):
+        """Determines the arguments, the call and the shuffling of arguments when first needed."""
+        if self._shuffle_arguments is not None:
+            return
 
-    def _generate_arguments(self, argumentContent):
-        # When the list of arguments is not given, we retrieve it from the procedure
-        if argumentContent is None:
-            argumentContent = self._match_procedure().group('arguments')
+        if self._givenArguments is None:
+            self._generate_arguments()
+        else:
+            self._generate_shuffle_arguments(self._givenArguments)
 
+    def _generate_arguments(self):
+        # When the list of arguments is not given, we retrieve it from the procedure.
         # The data gathered in argumentData is not fully used now, only the name
         # is needed later on. In future versions, it might be useful to also use
         # the type information.
-        argumentData = []
-
-        for match in argumentParser.finditer(argumentContent):
-            name  = match.group('name')
-            type  = match.group('type')
-            inout = match.group('inout')
-
-            argumentData.append((name, type, inout))
+        argumentData = self._parsed_header().arguments
 
         self._generate_shuffle_arguments(argumentData = argumentData)
 
@@ -392,15 +895,21 @@ Note that we first try to delete the procedure, and then insert it. Take great c
         self._shuffle_arguments = shuffle_argument
 
     def _generate_call(self, argCount):
-        """Generates the call to the procedure"""
-        self._call = 'CALL %s (%s)' % \
+        """Generates the call to the procedure, functions are called by selecting their value"""
+        self._call = ('SELECT %s(%s)' if self.kind == 'FUNCTION' else 'CALL %s (%s)') % \
             (
-                    connection.ops.quote_name(self.name)
+                    connection.ops.quote_name(self.versionName if self.versioned else self.name)
                 ,   ','.join('%s' for _ in xrange(0, argCount))
             )
 
     def __unicode__(self):
-        return u'%s (%s)' % (self.name, self.filename)
+        try:
+            name = self.name
+        except ProcedureConfigurationException:
+            # The procedure could not be read or parsed, which is being reported
+            name = u'?'
+
+        return u'%s (%s)' % (name, self.filename)
 
     def __str__(self):
         return unicode(self).encode('ascii', 'replace')
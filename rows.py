@@ -0,0 +1,49 @@
+from columns import fetchColumns
+import collections
+
+# The kinds of rows a result can consist of
+ROW_TYPES = ('tuple', 'named', 'columns')
+
+class RowFactory():
+    def __init__(self, rows = 'tuple'):
+        """Fetches the results from a cursor in the form given by `rows`.
+
+:param rows: `'tuple'` for plain tuples, `'named'` for named tuples or `'columns'` for a dictionary of columns, see :func:`~columns.fetchColumns`.
+
+For named tuples, a class is generated once for each shape of result, as given by the column names in `cursor.description`, and cached. Its instances are tuples, so they take no more memory than the rows themselves, but their values can also be accessed as attributes named after the columns. Column names that are not valid identifiers (for example `COUNT(*)`) are only accessible by position."""
+        self.rows = rows
+        self._classes = dict()
+
+    unbuffered = property(
+            fget = lambda self: self.rows == 'columns'
+        ,   doc  = 'Whether the results should be fetched from an unbuffered cursor'
+    )
+
+    def rowClass(self, description):
+        """Gives the class of the rows in a result with the given `cursor.description`."""
+        names = tuple(column[0] for column in description)
+
+        try:
+            return self._classes[names]
+        except KeyError:
+            rowClass = self._classes[names] = collections.namedtuple('Row', names, rename = True)
+
+            return rowClass
+
+    def build(self, description, rows):
+        """Converts the rows of a result with the given `cursor.description` into named tuples."""
+        make = self.rowClass(description)._make
+
+        return [make(row) for row in rows]
+
+    def fetch(self, cursor):
+        """Fetches all results from the cursor."""
+        if self.rows == 'columns':
+            return fetchColumns(cursor)
+
+        results = cursor.fetchall()
+
+        if self.rows == 'named' and cursor.description is not None:
+            results = self.build(cursor.description, results)
+
+        return results
@@ -0,0 +1,302 @@
+try:
+    from django.db import connection as defaultConnection
+    from django.db.utils import DatabaseError
+except Exception as exp:
+    print exp
+
+from _mysql import OperationalError
+import collections, re, time
+
+from exceptions import StatisticsUnavailableException
+from library import library
+from procedure import VERSION_LENGTH
+
+# The counters of each stored program, and the columns of
+# performance_schema.events_statements_summary_by_program they are read from.
+# Times are in picoseconds.
+PROGRAM_COUNTERS = collections.OrderedDict([
+        ('calls'                , 'COUNT_STAR')
+    ,   ('time'                 , 'SUM_TIMER_WAIT')
+    ,   ('lock_time'            , 'SUM_LOCK_TIME')
+    ,   ('statements'           , 'COUNT_STATEMENTS')
+    ,   ('rows_sent'            , 'SUM_ROWS_SENT')
+    ,   ('rows_examined'        , 'SUM_ROWS_EXAMINED')
+    ,   ('rows_affected'        , 'SUM_ROWS_AFFECTED')
+    ,   ('tmp_tables'           , 'SUM_CREATED_TMP_TABLES')
+    ,   ('tmp_disk_tables'      , 'SUM_CREATED_TMP_DISK_TABLES')
+    ,   ('sort_rows'            , 'SUM_SORT_ROWS')
+    ,   ('sort_merge_passes'    , 'SUM_SORT_MERGE_PASSES')
+    ,   ('full_joins'           , 'SUM_SELECT_FULL_JOIN')
+    ,   ('no_index_used'        , 'SUM_NO_INDEX_USED')
+    ,   ('errors'               , 'SUM_ERRORS')
+])
+
+PROGRAM_QUERY = '''
+    SELECT OBJECT_TYPE, OBJECT_NAME, %s
+    FROM performance_schema.events_statements_summary_by_program
+    WHERE OBJECT_SCHEMA = DATABASE() AND OBJECT_TYPE IN ('PROCEDURE', 'FUNCTION')
+''' % ', '.join(PROGRAM_COUNTERS.values())
+
+# The statements within stored programs are only kept in the history of recent
+# statements, which is why they are sampled rather than diffed
+STATEMENT_QUERY = '''
+    SELECT OBJECT_TYPE, OBJECT_NAME, DIGEST, DIGEST_TEXT, COUNT(*), SUM(TIMER_WAIT), SUM(ROWS_EXAMINED), SUM(ROWS_SENT)
+    FROM performance_schema.events_statements_history_long
+    WHERE OBJECT_SCHEMA = DATABASE() AND OBJECT_TYPE IN ('PROCEDURE', 'FUNCTION') AND TIMER_START > %s
+    GROUP BY OBJECT_TYPE, OBJECT_NAME, DIGEST, DIGEST_TEXT
+'''
+
+MARK_QUERY = 'SELECT MAX(TIMER_END) FROM performance_schema.events_statements_history_long'
+
+ENABLED_QUERY = 'SELECT @@performance_schema'
+
+PICOSECONDS = 1e12
+
+# Names of the versions of procedures, see StoredProcedure.versionName
+versionParser = re.compile(r'(?P<prefix>.*__)[0-9a-f]{%d}$' % VERSION_LENGTH, re.IGNORECASE)
+
+# Programs examining at least this many rows for each row they send are a concern
+EXAMINED_PER_SENT = 100
+
+StatementStatistics = collections.namedtuple('StatementStatistics', 'digest text calls time rows_examined rows_sent')
+
+class ProgramStatistics():
+    def __init__(self, kind, name, counters, statements = ()):
+        """Server-side statistics of a single stored procedure or function, as gathered by `performance_schema`.
+
+:param kind: `'PROCEDURE'` or `'FUNCTION'`.
+:param name: the name of the procedure.
+:param counters: a dictionary from the names in :data:`PROGRAM_COUNTERS` to their values.
+:param statements: the :class:`StatementStatistics` of the statements executed within the procedure, with times in seconds (default is none)."""
+        self.kind       = kind
+        self.name       = name
+        self.counters   = counters
+        self.statements = sorted(statements, key = lambda statement: statement.time, reverse = True)
+
+    calls = property(
+            fget = lambda self: self.counters['calls']
+        ,   doc  = 'The number of calls'
+    )
+
+    time = property(
+            fget = lambda self: self.counters['time'] / PICOSECONDS
+        ,   doc  = 'The number of seconds spent in the procedure'
+    )
+
+    averageTime = property(
+            fget = lambda self: self.time / self.calls if self.calls else 0.0
+        ,   doc  = 'The number of seconds a call took on average'
+    )
+
+    examinedPerSent = property(
+            fget = lambda self: float(self.counters['rows_examined']) / max(self.counters['rows_sent'], 1)
+        ,   doc  = 'The number of rows examined for each row sent'
+    )
+
+    def diff(self, earlier):
+        """Gives the statistics of the period since the statistics `earlier`, which may be `None`. When the counters have been reset in the meantime, the current ones are taken."""
+        if earlier is None:
+            return self
+
+        counters = dict((name, value - earlier.counters[name]) for (name, value) in self.counters.iteritems())
+
+        if any(value < 0 for value in counters.itervalues()):
+            counters = self.counters
+
+        return ProgramStatistics(self.kind, self.name, counters, self.statements)
+
+    def concerns(self):
+        """Gives a list of descriptions of what suggests that the procedure needs rewriting."""
+        counters = self.counters
+        concerns = []
+
+        if counters['rows_examined'] >= EXAMINED_PER_SENT and self.examinedPerSent >= EXAMINED_PER_SENT:
+            concerns.append('examines %d rows per row sent' % self.examinedPerSent)
+
+        if counters['no_index_used']:
+            concerns.append('%d statements used no index' % counters['no_index_used'])
+
+        if counters['full_joins']:
+            concerns.append('%d joins without an index' % counters['full_joins'])
+
+        if counters['tmp_disk_tables']:
+            concerns.append('%d temporary tables on disk' % counters['tmp_disk_tables'])
+
+        if counters['sort_merge_passes']:
+            concerns.append('%d sort merge passes' % counters['sort_merge_passes'])
+
+        return concerns
+
+    def __unicode__(self):
+        counters = self.counters
+
+        lines = [
+            u'%s %s: %d calls, %.2f ms in total, %.2f ms per call, %d rows examined, %d rows sent, %d temporary tables (%d on disk), %d rows sorted' % (
+                    self.kind.lower()
+                ,   self.name
+                ,   self.calls
+                ,   1000 * self.time
+                ,   1000 * self.averageTime
+                ,   counters['rows_examined']
+                ,   counters['rows_sent']
+                ,   counters['tmp_tables']
+                ,   counters['tmp_disk_tables']
+                ,   counters['sort_rows']
+            )
+        ]
+
+        lines.extend(u'    concern: %s' % concern for concern in self.concerns())
+        lines.extend(
+                u'    %8.2f ms  %6d calls  %8d examined  %8d sent  %s' % (1000 * statement.time, statement.calls, statement.rows_examined, statement.rows_sent, statement.text)
+            for statement in self.statements
+        )
+
+        return u'\n'.join(lines)
+
+    def __str__(self):
+        return unicode(self).encode('utf8', 'replace')
+
+class StatisticsReport():
+    def __init__(self, programs, elapsed = None):
+        """The server-side statistics of stored procedures over some period, see :meth:`Snapshot.diff`.
+
+:param programs: the :class:`ProgramStatistics` of each procedure, which are ordered by the time spent in them.
+:param elapsed: the number of seconds the period lasted, or `None` when the statistics cover the time since the server started."""
+        self.programs = sorted(programs, key = lambda program: program.counters['time'], reverse = True)
+        self.elapsed  = elapsed
+
+    def __iter__(self):
+        return iter(self.programs)
+
+    def __getitem__(self, name):
+        """Gives the statistics of the procedure with the given name.
+
+:raises: :exc:`KeyError` when the procedure was not called."""
+        for program in self.programs:
+            if program.name.lower() == name.lower():
+                return program
+
+        raise KeyError(name)
+
+    concerning = property(
+            fget = lambda self: [program for program in self.programs if program.concerns()]
+        ,   doc  = 'The statistics of the procedures which may need rewriting, see :meth:`ProgramStatistics.concerns`'
+    )
+
+    def __unicode__(self):
+        period = u'since the server started' if self.elapsed is None else u'over %.1f seconds' % self.elapsed
+
+        return u'\n'.join(
+                [u'%d procedures called %s' % (len(self.programs), period)]
+            +   [unicode(program) for program in self.programs]
+        )
+
+    def __str__(self):
+        return unicode(self).encode('utf8', 'replace')
+
+class Snapshot():
+    def __init__(self, programs, mark, taken):
+        """The cumulative server-side statistics of stored procedures at some moment, see :func:`takeSnapshot`.
+
+:param programs: a dictionary from the kind and lower-case name of each procedure to its :class:`ProgramStatistics`.
+:param mark: the time, according to `performance_schema`, of the last statement that had finished.
+:param taken: the time at which the snapshot was taken."""
+        self.programs = programs
+        self.mark     = mark
+        self.taken    = taken
+
+    def diff(self, earlier = None):
+        """Gives the :class:`StatisticsReport` of the period between the snapshot `earlier` and this one, or since the server started when `earlier` is `None`. Procedures which were not called in this period are left out."""
+        programs = [
+                program.diff(None if earlier is None else earlier.programs.get(key))
+            for (key, program) in self.programs.iteritems()
+        ]
+
+        return StatisticsReport(
+                [program for program in programs if program.calls > 0]
+            ,   None if earlier is None else self.taken - earlier.taken
+        )
+
+def takeSnapshot(procedures = None, statements = False, since = None, connection = None):
+    """Reads the statistics of stored procedures from `performance_schema.events_statements_summary_by_program`.
+
+:param procedures: the procedures to read the statistics of (default is all procedures registered with the library). The statistics of all versions of a procedure deployed versioned are added up under its name.
+:param statements: whether to also read the statistics of the statements within each procedure, by their digests. These are taken from `performance_schema.events_statements_history_long`, which only holds the most recent statements and requires its consumer to be enabled (default is `False`).
+:param since: an earlier :class:`Snapshot`, only statements after which are read (default is `None`, all statements in the history).
+:param connection: the database connection to read from, for example one to a local stand-in for the server (default is django's connection).
+:returns: a :class:`Snapshot`.
+:raises: :exc:`~exceptions.StatisticsUnavailableException` when `performance_schema` is disabled or could not be read."""
+    procedures = library.procedures if procedures is None else procedures
+    names = dict(((procedure.kind, procedure.name.lower()), procedure.name) for procedure in procedures)
+    prefixes = dict(((procedure.kind, procedure.versionPrefix.lower()), procedure.name) for procedure in procedures)
+
+    def programName(kind, name):
+        """Gives the name of the procedure a program in the database belongs to, or `None` when it is not wanted."""
+        if (kind, name.lower()) in names:
+            return names[(kind, name.lower())]
+
+        match = versionParser.match(name)
+
+        return None if match is None else prefixes.get((kind, match.group('prefix').lower()))
+
+    cursor = (defaultConnection if connection is None else connection).cursor()
+
+    try:
+        cursor.execute(ENABLED_QUERY)
+
+        if not cursor.fetchone()[0]:
+            raise StatisticsUnavailableException('performance_schema is disabled')
+
+        taken = time.time()
+
+        cursor.execute(PROGRAM_QUERY)
+        programRows = cursor.fetchall()
+
+        cursor.execute(MARK_QUERY)
+        mark = cursor.fetchone()[0] or 0
+
+        statementRows = ()
+
+        if statements:
+            cursor.execute(STATEMENT_QUERY, [0 if since is None else since.mark])
+            statementRows = cursor.fetchall()
+    except (DatabaseError, OperationalError) as exp:
+        raise StatisticsUnavailableException(exp)
+    finally:
+        cursor.close()
+
+    statementsByProgram = collections.defaultdict(list)
+
+    for (kind, name, digest, text, calls, wait, examined, sent) in statementRows:
+        name = programName(kind, name)
+
+        if name is not None:
+            statementsByProgram[(kind, name.lower())].append(
+                StatementStatistics(digest, text, int(calls), int(wait or 0) / PICOSECONDS, int(examined or 0), int(sent or 0))
+            )
+
+    counters = collections.defaultdict(lambda: dict.fromkeys(PROGRAM_COUNTERS, 0))
+    programNames = dict()
+
+    for row in programRows:
+        kind, name = row[0], programName(row[0], row[1])
+
+        if name is not None:
+            key = programNames[(kind, name.lower())] = (kind, name)
+
+            for counter, value in zip(PROGRAM_COUNTERS, row[2:]):
+                counters[key][counter] += int(value or 0)
+
+    programs = dict(
+            (lowerKey, ProgramStatistics(kind, name, counters[(kind, name)], statementsByProgram[lowerKey]))
+        for (lowerKey, (kind, name)) in programNames.iteritems()
+    )
+
+    return Snapshot(programs, int(mark), taken)
+
+def measureStatistics(function, procedures = None, statements = True, connection = None):
+    """Calls `function` and gives the :class:`StatisticsReport` of the stored procedures over the duration of the call, see :func:`takeSnapshot`."""
+    before = takeSnapshot(procedures, connection = connection)
+    function()
+
+    return takeSnapshot(procedures, statements, since = before, connection = connection).diff(before)
@@ -1,15 +1,22 @@
 from library import library
 
 try:
-    from django.db.utils import DatabaseError
     from django.db import connection
 except Exception as exp:
     print exp
 
-from _mysql import OperationalError
 import warnings
 
 from exceptions import *
+from rows import RowFactory, ROW_TYPES
+from cursors import unbufferedCursor, discardCursor, DATABASE_ERRORS
+from columns import FETCH_SIZE
+from memoization import memoize, unmemoized
+from tokenizer import tokenize, isWord, ParseError
+import functools
+
+# Statements starting with these words only read data
+READING_STATEMENTS = ('SELECT', 'SHOW', 'DESCRIBE', 'DESC', 'EXPLAIN')
 
 class SQL():
     def __init__(
@@ -17,6 +24,8 @@ class SQL():
             ,   content
             ,   yield_results = True
             ,   raise_warnings  = False
+            ,   rows            = 'tuple'
+            ,   writes          = None
             ):
         """Wrapper for raw SQL statements.
 
@@ -28,9 +37,21 @@ This allows one to wrap raw SQL code, with the same name-reference system as in
 :type yield_results: `bool`
 :param raise_warnings: Whether warnings should be raised as an `Exception`, in the case that `yield_results` is set to `True` (default if `False`)
 :type raise_warnings: `bool`
+:param rows: The kind of rows in the results, either `'tuple'`, `'named'` or `'columns'`, as for :class:`procedure.StoredProcedure` (default is `'tuple'`). With `'columns'` the count yielded is the number of rows fetched.
+:type rows: `string`
+:param writes: Whether the SQL modifies data, see :class:`~memoization.MemoizationScope` (default is `None`: only statements starting with `SELECT`, `SHOW`, `DESCRIBE` or `EXPLAIN` are taken to only read data)
+:type writes: `bool`
+:raises: :exc:`ValueError` when `rows` is not one of the above.
 """
+        if not rows in ROW_TYPES:
+            raise ValueError('rows should be one of %s, not %r' % (', '.join(ROW_TYPES), rows))
+
         self._raw_content  = content
         self._yield_results = yield_results
+        self._raise_warnings = raise_warnings
+        self._rowFactory = RowFactory(rows)
+        self._writes = writes
+        self._dependencies = None
 
     @property
     def content(self):
@@ -42,28 +63,99 @@ This allows one to wrap raw SQL code, with the same name-reference system as in
 
         return self._rendered_content
 
+    @property
+    def writes(self):
+        """Whether the SQL modifies data"""
+        if self._writes is None:
+            try:
+                first = next(tokenize(self._raw_content), None)
+            except ParseError:
+                first = None
+
+            self._writes = not isWord(first, *READING_STATEMENTS)
+
+        return self._writes
+
+    @property
+    def dependencies(self):
+        """The set of models, as `app.Model`, the SQL refers to"""
+        if self._dependencies is None:
+            self._dependencies = library.references(self._raw_content)
+
+        return self._dependencies
+
     def __call__(self, *args, **kwargs):
-        """Execute the SQL query"""
-        cursor = connection.cursor()
+        """Execute the SQL query. Within a :class:`~memoization.MemoizationScope`, results are memoized by their arguments."""
+        if not self._yield_results:
+            # A cursor can not be memoized
+            return unmemoized(self, functools.partial(self._execute, args))
+
+        return memoize(self, args, functools.partial(self._execute, args))
+
+    def _execute(self, args):
+        """Execute the SQL query with the given arguments"""
+        unbuffered = self._yield_results and self._rowFactory.unbuffered
+        cursor = unbufferedCursor() if unbuffered else connection.cursor()
 
         try:
             resultCount = cursor.execute(self.content, args)
-        except (DatabaseError, OperationalError) as exp:
+
+            if self._yield_results:
+                with warnings.catch_warnings(record = True) as ws:
+                    warnings.simplefilter('always' if self._raise_warnings else 'ignore')
+
+                    results = self._rowFactory.fetch(cursor)
+                    cursor.close()
+        except DATABASE_ERRORS as exp:
+            discardCursor(cursor)
             raise RawSQLException(exp)
+        except:
+            discardCursor(cursor)
+            raise
+
+        if not self._yield_results:
+            return (resultCount, cursor)
+
+        if len(ws) >= 1:
+            raise RawSQLWarning(warnings = ws)
+
+        if unbuffered:
+            # The number of rows is only known after fetching them all
+            resultCount = len(results.values()[0]) if results else 0
+
+        return (resultCount, results)
+
+    def export(self, sink, arguments = (), format = 'csv', progress = None, size = FETCH_SIZE):
+        """Executes the query with the given arguments and streams its results into `sink`, just like :meth:`procedure.StoredProcedure.export`.
+
+:returns: the number of rows written."""
+        return unmemoized(self, functools.partial(self._export, sink, arguments, format, progress, size))
+
+    def _export(self, sink, arguments, format, progress, size):
+        """Streams the results of the query into `sink`, see :meth:`~sql.SQL.export`."""
+        from export import exportRows
+
+        cursor = unbufferedCursor()
+
+        try:
+            cursor.execute(self.content, arguments)
 
-        if self._yield_results:
             with warnings.catch_warnings(record = True) as ws:
                 warnings.simplefilter('always' if self._raise_warnings else 'ignore')
 
-                results = cursor.fetchall()
+                count = exportRows(cursor, sink, format, progress, size)
                 cursor.close()
+        except DATABASE_ERRORS as exp:
+            discardCursor(cursor)
+            raise RawSQLException(exp)
+        except:
+            discardCursor(cursor)
+            raise
 
-                if len(ws) >= 1:
-                    raise RawSQLWarning(warnings = ws)
+        if len(ws) >= 1:
+            raise RawSQLWarning(warnings = ws)
 
-            return (resultCount, results)
-        else:
-            return (resultCount, cursor)
+        return count
 
     def __unicode__(self):
         return self.content
@@ -0,0 +1,446 @@
+import bisect, collections, re
+
+# A single pass over the source: every alternative below either consumes its
+# token in linear time or fails on its first character, so tokenizing never
+# backtracks over more than the token at hand. Whitespace is consumed along
+# with the token following it, which saves a match for most tokens.
+tokenParser = re.compile(r'''
+    \s*(?:
+        (?P<comment>(?:--(?=\s|$)|\#)[^\n]*|/\*.*?\*/)
+    |   (?P<template>\{\{.*?\}\}|\{%.*?%\}|\{\#.*?\#\})
+    |   (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |   (?P<name>`(?:[^`]|``)*`)
+    |   (?P<reference>\[[\w.]+\])
+    |   (?P<word>[\w$]+)
+    |   (?P<symbol>.)
+    )''', re.VERBOSE | re.DOTALL | re.UNICODE)
+
+# A plain argument, such as `IN amount DECIMAL(10,2) UNSIGNED`, followed by the
+# comma or parenthesis ending it. Arguments are matched by this expression as
+# long as they can be, which saves going over their tokens one by one; anything
+# else, such as comments, quoted names or ENUM types, is left to the tokens.
+argumentParser = re.compile(r'''
+    \s*(?:(?P<inout>IN|OUT|INOUT)\s+)?
+    (?P<name>[\w$]+)\s+
+    (?P<type>\w+(?:\s*\(\s*\d+(?:\s*,\s*\d+)?\s*\))?(?:\s+\w+)*)
+    \s*(?P<end>[,)])
+    ''', re.VERBOSE | re.IGNORECASE | re.UNICODE)
+
+# The DELIMITER command of the mysql client, which takes up a line of its own
+delimiterParser = re.compile(r'^[ \t]*DELIMITER[ \t]+(?P<delimiter>\S+)[ \t]*$', re.IGNORECASE | re.MULTILINE)
+
+ROUTINE_KINDS = ('PROCEDURE', 'FUNCTION')
+
+PARAMETER_MODES = frozenset(['IN', 'OUT', 'INOUT'])
+
+# Words closed by a plain END in the body of a routine, and the words which
+# follow END when it closes something else, such as END IF
+BLOCK_WORDS = ('BEGIN', 'CASE')
+END_SUFFIXES = ('IF', 'LOOP', 'WHILE', 'REPEAT')
+
+# Words that start a characteristic of the routine, and hence end a RETURNS clause
+CHARACTERISTIC_WORDS = frozenset(['COMMENT', 'LANGUAGE', 'NOT', 'DETERMINISTIC', 'CONTAINS', 'NO', 'READS', 'MODIFIES', 'SQL'])
+
+Token = collections.namedtuple('Token', 'kind value start end')
+
+RoutineHeader = collections.namedtuple('RoutineHeader', 'kind name arguments returns characteristics name_start name_end body_start')
+
+class ParseError(ValueError):
+    """Raised when the header of a stored routine could not be parsed."""
+    pass
+
+def tokenize(text, position = 0):
+    """Yields the :class:`Token` instances in `text` starting at `position`, skipping whitespace and comments.
+
+:raises: :exc:`ParseError` when a string or quoted name is not terminated."""
+    match = tokenParser.match
+    length = len(text)
+
+    while position < length:
+        found = match(text, position)
+
+        # Only whitespace remains
+        if found is None:
+            return
+
+        kind  = found.lastgroup
+        value = found.group(kind)
+        start = found.start(kind)
+        end   = found.end()
+
+        if kind == 'symbol' and value in '\'"`':
+            raise ParseError('Unterminated quote at position %d' % start)
+
+        if kind != 'comment':
+            yield Token(kind, value, start, end)
+
+        position = end
+
+def unquote(token):
+    """Gives the identifier denoted by a word or quoted name token."""
+    if token.kind == 'name':
+        return token.value[1:-1].replace('``', '`')
+
+    return token.value
+
+def isWord(token, *words):
+    return token is not None and token.kind == 'word' and token.value.upper() in words
+
+class HeaderParser():
+    def __init__(self, text, position = 0):
+        """Parser for the header of a single `CREATE PROCEDURE` or `CREATE FUNCTION` statement, see :func:`parseHeader`."""
+        self._text   = text
+        self._tokens = tokenize(text, position)
+        self._peeked = None
+
+    def restart(self, position):
+        """Continues with the tokens starting at `position`."""
+        self._tokens = tokenize(self._text, position)
+        self._peeked = None
+
+    def peek(self):
+        if self._peeked is None:
+            self._peeked = next(self._tokens, None)
+
+        return self._peeked
+
+    def next(self):
+        token = self.peek()
+        self._peeked = None
+
+        if token is None:
+            raise ParseError('Unexpected end of the routine header')
+
+        return token
+
+    def expect(self, *words):
+        token = self.next()
+
+        if not isWord(token, *words):
+            raise ParseError('Expected %s at position %d, found %r' % ('/'.join(words), token.start, token.value))
+
+        return token
+
+    def expectSymbol(self, symbol):
+        token = self.next()
+
+        if token.value != symbol:
+            raise ParseError('Expected %r at position %d, found %r' % (symbol, token.start, token.value))
+
+        return token
+
+    def skipWords(self, *words):
+        """Consumes the given words, in order, when the next tokens are exactly these words."""
+        if isWord(self.peek(), words[0]):
+            for word in words:
+                self.expect(word)
+
+            return True
+
+        return False
+
+    def parse(self):
+        # Template tags, such as {% load %}, may precede the statement
+        while self.peek() is not None and self.peek().kind == 'template':
+            self.next()
+
+        self.expect('CREATE')
+        self.skipWords('OR', 'REPLACE')
+
+        if isWord(self.peek(), 'DEFINER'):
+            self.parseDefiner()
+
+        self.skipWords('AGGREGATE')
+
+        kind = self.expect(*ROUTINE_KINDS).value.upper()
+
+        self.skipWords('IF', 'NOT', 'EXISTS')
+
+        name, name_start, name_end = self.parseName()
+        arguments = self.parseArguments(kind)
+
+        returns = None
+
+        if kind == 'FUNCTION':
+            self.expect('RETURNS')
+            returns = self.parseType(terminators = ())
+
+        characteristics = self.parseCharacteristics()
+
+        body = self.peek()
+
+        return RoutineHeader(
+                kind            = kind
+            ,   name            = name
+            ,   arguments       = arguments
+            ,   returns         = returns
+            ,   characteristics = characteristics
+            ,   name_start      = name_start
+            ,   name_end        = name_end
+            ,   body_start      = len(self._text) if body is None else body.start
+        )
+
+    def parseDefiner(self):
+        """Skips `DEFINER = user`, where user is `CURRENT_USER`, optionally followed by parentheses, or `name@host` with both parts possibly quoted."""
+        self.expect('DEFINER')
+        self.expectSymbol('=')
+
+        user = self.next()
+
+        if isWord(user, 'CURRENT_USER'):
+            if self.peek() is not None and self.peek().value == '(':
+                self.expectSymbol('(')
+                self.expectSymbol(')')
+        elif self.peek() is not None and self.peek().value == '@':
+            self.next()
+            self.next()
+
+    def parseName(self):
+        """Parses a possibly schema-qualified routine name, yields the name and the positions where it occurs. The name is `None` when it is given by means of a template."""
+        token = self.next()
+
+        if self.peek() is not None and self.peek().value == '.':
+            self.next()
+            token = self.next()
+
+        if token.kind in ('word', 'name'):
+            return unquote(token), token.start, token.end
+        elif token.kind == 'template':
+            return None, token.start, token.end
+
+        raise ParseError('Expected the name of the routine at position %d, found %r' % (token.start, token.value))
+
+    def parseArguments(self, kind):
+        arguments = []
+        position = self.expectSymbol('(').end
+
+        while True:
+            found = argumentParser.match(self._text, position)
+
+            # Parameter modes are only allowed for procedures
+            if found is None or (found.group('inout') is not None and kind != 'PROCEDURE'):
+                break
+
+            arguments.append((found.group('name'), found.group('type'), (found.group('inout') or 'IN').upper()))
+            position = found.end()
+
+            if found.group('end') == ')':
+                self.restart(position)
+                return arguments
+
+        self.restart(position)
+
+        if not arguments and self.peek() is not None and self.peek().value == ')':
+            self.next()
+            return arguments
+
+        while True:
+            token = self.next()
+
+            if kind == 'PROCEDURE' and isWord(token, *PARAMETER_MODES):
+                inout = token.value.upper()
+                token = self.next()
+            else:
+                # Parameters are IN by default, and always for functions
+                inout = 'IN'
+
+            if not token.kind in ('word', 'name'):
+                raise ParseError('Expected an argument name at position %d, found %r' % (token.start, token.value))
+
+            arguments.append((unquote(token), self.parseType(terminators = (',', ')')), inout))
+
+            if self.next().value == ')':
+                return arguments
+
+    def parseType(self, terminators):
+        """Parses a data type, which ends just before one of the terminators at parenthesis depth zero. When no terminators are given, the type ends at the routine's characteristics or body."""
+        depth = 0
+        start = end = None
+
+        while True:
+            token = self.peek()
+
+            if token is None:
+                if terminators:
+                    raise ParseError('Unexpected end of the routine header')
+                break
+
+            if depth == 0:
+                if token.value in terminators:
+                    break
+
+                if not terminators and start is not None and \
+                        (isWord(token, 'BEGIN', 'RETURN', *CHARACTERISTIC_WORDS) or token.value == ';'):
+                    break
+
+            if token.value == '(':
+                depth += 1
+            elif token.value == ')':
+                depth -= 1
+
+            if start is None:
+                start = token.start
+
+            end = token.end
+            self.next()
+
+        if start is None:
+            raise ParseError('Expected a data type')
+
+        return self._text[start:end]
+
+    def parseCharacteristics(self):
+        characteristics = []
+
+        while True:
+            token = self.peek()
+
+            if isWord(token, 'COMMENT'):
+                self.next()
+                characteristics.append('COMMENT %s' % self.next().value)
+            elif isWord(token, 'LANGUAGE'):
+                self.next()
+                characteristics.append('LANGUAGE %s' % self.expect('SQL').value.upper())
+            elif isWord(token, 'DETERMINISTIC'):
+                self.next()
+                characteristics.append('DETERMINISTIC')
+            elif isWord(token, 'NOT'):
+                self.next()
+                self.expect('DETERMINISTIC')
+                characteristics.append('NOT DETERMINISTIC')
+            elif isWord(token, 'CONTAINS'):
+                self.next()
+                self.expect('SQL')
+                characteristics.append('CONTAINS SQL')
+            elif isWord(token, 'NO'):
+                self.next()
+                self.expect('SQL')
+                characteristics.append('NO SQL')
+            elif isWord(token, 'READS', 'MODIFIES'):
+                self.next()
+                self.expect('SQL')
+                self.expect('DATA')
+                characteristics.append('%s SQL DATA' % token.value.upper())
+            elif isWord(token, 'SQL'):
+                self.next()
+                self.expect('SECURITY')
+                characteristics.append('SQL SECURITY %s' % self.expect('DEFINER', 'INVOKER').value.upper())
+            else:
+                return characteristics
+
+def parseHeader(text, position = 0):
+    """Parses the header of the `CREATE PROCEDURE` or `CREATE FUNCTION` statement starting at `position` in `text`.
+
+:returns: A :class:`RoutineHeader` with the kind of routine, its name, its arguments as a list of tuples `(name, type, inout)`, the type it returns (functions only), its characteristics, the positions of its name and the position where its body starts.
+:raises: :exc:`ParseError` when the header could not be parsed.
+
+Only the header is read, so the time taken does not depend on the size of the body. Comments, quoted names and strings, `DEFINER` clauses and parenthesized types such as `DECIMAL(10,2)` are handled."""
+    return HeaderParser(text, position).parse()
+
+def startsRoutine(tokens, index):
+    """Whether the `CREATE` statement at `index` in the list `tokens` creates a procedure or function."""
+    if not isWord(tokens[index], 'CREATE'):
+        return False
+
+    index += 1
+
+    if isWord(tokens[index] if index < len(tokens) else None, 'OR'):
+        index += 2
+
+    if isWord(tokens[index] if index < len(tokens) else None, 'DEFINER'):
+        # Skip DEFINER, =, and a user which is either CURRENT_USER, CURRENT_USER()
+        # or name@host
+        index += 3
+
+        while index < len(tokens) and tokens[index].value in ('@', '(', ')'):
+            index += 2 if tokens[index].value == '@' else 1
+
+    if isWord(tokens[index] if index < len(tokens) else None, 'AGGREGATE'):
+        index += 1
+
+    return isWord(tokens[index] if index < len(tokens) else None, *ROUTINE_KINDS)
+
+def routineEnd(tokens, index, stop):
+    """Gives the position of the semicolon ending the routine whose `CREATE` is at `index` in the list `tokens`, or `None` when there is none before the token at `stop`. Semicolons within `BEGIN ... END` blocks and `CASE ... END` are skipped."""
+    depth = 0
+
+    while index < stop:
+        token = tokens[index]
+
+        if token.value == ';' and depth == 0:
+            return token.start
+        elif isWord(token, *BLOCK_WORDS):
+            depth += 1
+        elif isWord(token, 'END'):
+            following = tokens[index + 1] if index + 1 < len(tokens) else None
+
+            if isWord(following, *END_SUFFIXES):
+                index += 1
+            else:
+                depth = max(depth - 1, 0)
+
+                # END CASE closes the CASE itself
+                if isWord(following, 'CASE'):
+                    index += 1
+
+        index += 1
+
+    return None
+
+def splitRoutines(text):
+    """Splits `text` into the `CREATE PROCEDURE` and `CREATE FUNCTION` statements it contains.
+
+:returns: A list with the source of each routine, without the delimiter ending it. Any text preceding the first routine, such as comments, is part of the first source, unless it ends in a statement, such as `DROP PROCEDURE`. Statements between or after routines, such as `GRANT`, are left out.
+
+Statements are found on the level of tokens, so routines mentioned in comments or strings are not split upon. A routine ends at the first semicolon outside its `BEGIN ... END` blocks. Files written for the mysql client may change the delimiter by means of `DELIMITER $$`; these commands are left out, and each routine ends at the first custom delimiter following it, if that comes first."""
+    delimiters = set()
+
+    def blank(match):
+        delimiters.add(match.group('delimiter'))
+
+        # Keep the positions of everything else
+        return ' ' * len(match.group(0))
+
+    text = delimiterParser.sub(blank, text)
+    delimiters.discard(';')
+
+    tokens = list(tokenize(text))
+    indices = [index for index in xrange(len(tokens)) if startsRoutine(tokens, index)]
+    starts = [tokens[index].start for index in indices]
+
+    if len(starts) == 0:
+        return []
+
+    # The positions and lengths of the custom delimiters, which may be part of
+    # a word token, as in END$$, or consist of several symbols, as in //
+    ends = sorted(
+            (text.find(delimiter, token.start, token.end + len(delimiter) - 1), len(delimiter))
+        for token in tokens
+        if not token.kind in ('string', 'name', 'template')
+        for delimiter in delimiters
+        if text.find(delimiter, token.start, token.end + len(delimiter) - 1) != -1
+    )
+
+    # The first routine starts after any statement preceding it
+    preceding = [position + length for (position, length) in ends if position < starts[0]] + \
+        [token.end for token in tokens if token.start < starts[0] and token.value == ';']
+
+    starts[0] = max(preceding) if preceding else 0
+
+    ends = [position for (position, _) in ends]
+    routines = []
+
+    for routine, (start, end) in enumerate(zip(starts, starts[1:] + [len(text)])):
+        index = bisect.bisect_left(ends, start)
+
+        if index < len(ends) and ends[index] < end:
+            end = ends[index]
+
+        bodyEnd = routineEnd(tokens, indices[routine], indices[routine + 1] if routine + 1 < len(indices) else len(tokens))
+
+        if bodyEnd is not None and bodyEnd < end:
+            end = bodyEnd
+
+        routines.append(text[start:end].strip())
+
+    return routines
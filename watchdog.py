@@ -0,0 +1,59 @@
+try:
+    from django.db import connection
+except Exception as exp:
+    print exp
+
+import threading
+
+class QueryWatchdog():
+    def __init__(self, timeout):
+        """Guards the statement running on the current database connection with a time limit.
+
+:param timeout: The number of seconds the statement may run, or `None` for no limit at all.
+:type timeout: `float`
+
+Use this as a context manager around the execution of a statement. When the time limit expires before the block is left, the statement is cancelled server-side by means of `KILL QUERY` and :attr:`fired` is set. The database then interrupts the statement, which frees the waiting thread. The `KILL QUERY` is sent over a separate connection: django keeps one connection per thread, so the timer's thread automatically obtains its own."""
+        self.timeout    = timeout
+        self._lock      = threading.Lock()
+        self._timer     = None
+        self._active    = False
+        self.fired      = False
+
+    def __enter__(self):
+        if self.timeout is None:
+            return self
+
+        # The server-side id of the connection running the statement
+        self._thread_id = connection.connection.thread_id()
+        self._active    = True
+
+        self._timer = threading.Timer(self.timeout, self._cancel)
+        self._timer.daemon = True
+        self._timer.start()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._timer is not None:
+            # Holding the lock ensures a pending KILL QUERY has finished before
+            # the connection is used for anything else
+            with self._lock:
+                self._active = False
+
+            self._timer.cancel()
+
+        return False
+
+    def _cancel(self):
+        with self._lock:
+            if not self._active:
+                return
+
+            self.fired = True
+
+            try:
+                cursor = connection.cursor()
+                cursor.execute('KILL QUERY %s', [self._thread_id])
+                cursor.close()
+            finally:
+                connection.close()